@@ -1,9 +1,32 @@
 # app/cir_schema.py
+import copy
+from typing import List
+from jsonschema import Draft202012Validator
+try:
+    import fastjsonschema
+except ImportError:  # optional accelerator; jsonschema stays the reference engine
+    fastjsonschema = None
 from app.enums import (
     ITEM_TYPES, FIELD_VALIDATOR_TYPES, HINTS, FLAG_COLORS, NOTE_STYLES,
     DATA_SECURITY_MODES, NOTE_TYPES, ITEM_SUBCATEGORIES, EMR_FIELDS
 )
 
+# One sorted list per enum, shared by every "enum" slot below (don't mutate it).
+# Validation is membership-based, so order only matters for the serialized schema:
+# keep it sorted so the JSON we send to the model is identical across processes
+# (set iteration order is not, under hash randomization). Lists, not tuples, so
+# /validate-cir messages quote the allowed values as [...] like before.
+def _enum(values) -> List[str]:
+    return sorted(values)
+
+_NOTE_TYPES = _enum(NOTE_TYPES)
+_DATA_SECURITY_MODES = _enum(DATA_SECURITY_MODES)
+_NOTE_STYLES = _enum(NOTE_STYLES)
+_FLAG_COLORS = _enum(FLAG_COLORS)
+_HINTS = _enum(HINTS)
+_ITEM_TYPES = _enum(ITEM_TYPES)
+_FIELD_VALIDATOR_TYPES = _enum(FIELD_VALIDATOR_TYPES)
+
 CIR_JSON_SCHEMA = {
   "type": "object",
   "additionalProperties": False,
@@ -17,8 +40,8 @@ CIR_JSON_SCHEMA = {
         "title": {"type": "string", "minLength": 1},
         "shortForm": {"type": "string"},
         "noteVersion": {"type": "integer"},
-        "noteType": {"type": "string", "enum": sorted(list(NOTE_TYPES))},
-        "dataSecurityMode": {"type": "string", "enum": sorted(list(DATA_SECURITY_MODES))}
+        "noteType": {"type": "string", "enum": _NOTE_TYPES},
+        "dataSecurityMode": {"type": "string", "enum": _DATA_SECURITY_MODES}
       }
     },
     "desc": {"type": "string"},
@@ -41,18 +64,18 @@ CIR_JSON_SCHEMA = {
           "additionalProperties": False,
           "properties": {
             "subcategory": {"type": "string"},
-            "headerStyle": {"type": "string", "enum": sorted(list(NOTE_STYLES))},
+            "headerStyle": {"type": "string", "enum": _NOTE_STYLES},
             "groupItems": {"type": "boolean"},
             "quoteAnswers": {"type": "boolean"},
             "expandIf": {"type": "string"},
             "showIf": {"type": "string"},
             "makeNoteIf": {"type": "string"},
-            "flag": {"type": "string", "enum": sorted(list(FLAG_COLORS))},
+            "flag": {"type": "string", "enum": _FLAG_COLORS},
             "noteIndex": {"type": "string"},
             "ownLine": {"type": "boolean"}
           }
         },
-        "hints": {"type": "array", "items": {"type": "string", "enum": sorted(list(HINTS))}},
+        "hints": {"type": "array", "items": {"type": "string", "enum": _HINTS}},
         "items": {"type": "array", "items": {"anyOf": [{"$ref": "#/$defs/section"}, {"$ref": "#/$defs/item"}]}}
       }
     },
@@ -65,7 +88,7 @@ CIR_JSON_SCHEMA = {
         "display": {"type": "string"},
         # ACCEPT number OR string for points (LLM/normalizer may produce either)
         "points": {"anyOf": [{"type": "number"}, {"type": "string"}]},
-        "flag": {"type": "string", "enum": sorted(list(FLAG_COLORS))},
+        "flag": {"type": "string", "enum": _FLAG_COLORS},
         "note": {"type": "string"}
       }
     },
@@ -76,7 +99,7 @@ CIR_JSON_SCHEMA = {
       "properties": {
         "kind": {"type": "string", "const": "item"},
         "ref": {"type": "string"},
-        "type": {"type": "string", "enum": sorted(list(ITEM_TYPES))},
+        "type": {"type": "string", "enum": _ITEM_TYPES},
 
         # NEW: allow authoring fields that map to <c> and <cNote> in XML
         "label": {"type": "string"},
@@ -98,23 +121,56 @@ CIR_JSON_SCHEMA = {
         "studyColumnHeader": {"type": "string"},
         "markableDiagramFileName": {"type": "string"},
         "dxCode": {"type": "string"},
-        "flag": {"type": "string", "enum": sorted(list(FLAG_COLORS))},
-        "negFlag": {"type": "string", "enum": sorted(list(FLAG_COLORS))},
+        "flag": {"type": "string", "enum": _FLAG_COLORS},
+        "negFlag": {"type": "string", "enum": _FLAG_COLORS},
         "emrField": {"type": "string"},
         "choices": {"type": "array", "items": {"$ref": "#/$defs/choice"}},
         "validator": {
           "type": "object",
           "additionalProperties": False,
           "properties": {
-            "type": {"type": "string", "enum": sorted(list(FIELD_VALIDATOR_TYPES))},
+            "type": {"type": "string", "enum": _FIELD_VALIDATOR_TYPES},
             "format": {"type": "string"},
             "message": {"type": "string"},
             "allowEmpty": {"type": "boolean"},
             "validIf": {"type": "string"}
           }
         },
-        "hints": {"type": "array", "items": {"type": "string", "enum": sorted(list(HINTS))}}
+        "hints": {"type": "array", "items": {"type": "string", "enum": _HINTS}}
       }
     }
   }
 }
+
+# Validation-only variant. A section's children are either sections or items and
+# always carry "kind", so dispatch on it with if/then/else instead of anyOf: each
+# child is checked against exactly one branch (and errors point inside that
+# branch instead of "not valid under any of the given schemas"). The accepted
+# documents are the same. CIR_JSON_SCHEMA itself keeps anyOf because it is also
+# sent to the model, and structured outputs do not support if/then/else.
+CIR_VALIDATION_SCHEMA = copy.deepcopy(CIR_JSON_SCHEMA)
+CIR_VALIDATION_SCHEMA["$defs"]["section"]["properties"]["items"]["items"] = {
+  "if": {"properties": {"kind": {"const": "section"}}, "required": ["kind"]},
+  "then": {"$ref": "#/$defs/section"},
+  "else": {"$ref": "#/$defs/item"}
+}
+
+# The schema is static: build the validator (and its $ref resolver) once at
+# import instead of on every request. jsonschema collects *every* error, which
+# is what we report back to callers.
+CIR_VALIDATOR = Draft202012Validator(CIR_VALIDATION_SCHEMA)
+
+# fastjsonschema generates plain Python for the schema (~10x faster on our forms)
+# but stops at the first error, so it only answers "is this valid?"; invalid
+# documents are re-checked with CIR_VALIDATOR to build the full issue list.
+_FAST_VALIDATE = fastjsonschema.compile(CIR_VALIDATION_SCHEMA, use_default=False) if fastjsonschema else None
+
+def is_valid_cir(obj) -> bool:
+    """Fast validity check against the CIR schema (no error details)."""
+    if _FAST_VALIDATE is None:
+        return CIR_VALIDATOR.is_valid(obj)
+    try:
+        _FAST_VALIDATE(obj)
+    except fastjsonschema.JsonSchemaException:
+        return False
+    return True
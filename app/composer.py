@@ -1,18 +1,66 @@
 # app/composer.py
-from xml.etree.ElementTree import Element, SubElement, tostring
-from xml.dom import minidom
-from typing import Dict, List, Optional
+try:
+    from lxml.etree import Element, SubElement, tostring
+    _LXML = True
+except ImportError:  # stdlib fallback: same Element API, pretty-printed in place by ET.indent
+    from xml.etree.ElementTree import Element, SubElement, tostring, indent
+    _LXML = False
+from typing import Dict, List, Optional, Tuple
 from app.config import DEFAULT_NOTE_VERSION
 
+# Attribute emission order per element. XML attribute names match the CIR keys,
+# so each table is read straight off the node.
+_MEDIA_TAGS = {"PICTURE": "picture", "VIDEO": "video", "DIAGRAM": "diagram"}
+_REF_ATTR = ("ref",)
+_MEDIA_ATTRS = ("ref", "subcategory", "x", "y", "showIf", "makeNoteIf", "noteIndex")
+_ITEM_ATTRS = (
+    "subcategory", "x", "y", "formula", "showIf", "makeNoteIf", "noteIndex",
+    "flag", "negFlag", "emrField",
+)
+_ITEM_BOOL_ATTRS = ("ownLine", "quoteAnswer")
+# (CIR key, child tag) in emission order. Authoring fields:
+# - label -> <c>
+# - cNote -> <cNote>
+# - text  -> <text> (prefill or macro/default)
+_ITEM_TEXT_TAGS = (
+    ("label", "c"), ("cNote", "cNote"), ("text", "text"),
+    ("tooltip", "tooltip"), ("studyColumnHeader", "studyColumnHeader"),
+    ("markableDiagramFileName", "markableDiagramFileName"),
+)
+_VALIDATOR_ATTRS = ("type", "format", "message")
+_CHOICE_ATTRS = ("val", "points", "flag")
+_SECTION_ATTRS = ("subcategory", "headerStyle", "expandIf", "showIf", "makeNoteIf", "flag", "noteIndex")
+_SECTION_BOOL_ATTRS = ("groupItems", "quoteAnswers", "ownLine")
+_EMPTY: Dict = {}  # read-only stand-in for a missing section "attributes"
+
 def _attr(el: Element, pairs: List[tuple]):
     """Set attributes in a stable order; skip empty strings/None."""
     for k, v in pairs:
-        if v is None: 
+        if v is None:
+            continue
+        if type(v) is str:  # the common case: no str() round-trip
+            if v:
+                el.set(k, v)
             continue
         vs = str(v)
-        if vs == "":
+        if vs:
+            el.set(k, vs)
+
+def _attr_keys(el: Element, src: Dict, keys: Tuple[str, ...]):
+    """_attr for a key table: attribute k takes src[k]; skip empty strings/None."""
+    get = src.get
+    set_ = el.set
+    for k in keys:
+        v = get(k)
+        if v is None:
             continue
-        el.set(k, vs)
+        if type(v) is str:
+            if v:
+                set_(k, v)
+            continue
+        vs = str(v)
+        if vs:
+            set_(k, vs)
 
 def _set_bool_attr(el: Element, name: str, val: Optional[bool]):
     if val is None:
@@ -20,127 +68,123 @@ def _set_bool_attr(el: Element, name: str, val: Optional[bool]):
     el.set(name, "true" if val else "false")
 
 def _text(parent: Element, tag: str, value: Optional[str]):
-    if value is not None and str(value).strip() != "":
-        s = SubElement(parent, tag)
-        s.text = str(value)
+    """Add <tag>value</tag> unless value is None/blank (isspace() avoids a strip() copy)."""
+    if value is None:
+        return
+    if type(value) is not str:
+        value = str(value)
+    if not value or value.isspace():
+        return
+    s = SubElement(parent, tag)
+    s.text = value
+
+def _hints(parent: Element, hints: List[str]):
+    # Ocean reads one <hint> element per entry, so these stay separate elements
+    # (a single newline-joined text node would not be read back as hints).
+    box = SubElement(parent, "hints")
+    sub = SubElement
+    for h in hints:
+        sub(box, "hint").text = h
 
 def _compose_item(parent_items: Element, node: Dict):
-    itype = node.get("type") or "LABEL"
-    if itype in {"PICTURE", "VIDEO", "DIAGRAM"}:
-        tag = "picture" if itype == "PICTURE" else ("video" if itype == "VIDEO" else "diagram")
-        el = SubElement(parent_items, tag)
-        _attr(el, [
-            ("ref", node.get("ref")),
-            ("subcategory", node.get("subcategory")),
-            ("x", node.get("x")), ("y", node.get("y")),
-            ("showIf", node.get("showIf")),
-            ("makeNoteIf", node.get("makeNoteIf")),
-            ("noteIndex", node.get("noteIndex")),
-        ])
-        _set_bool_attr(el, "ownLine", node.get("ownLine"))
+    get = node.get
+    sub = SubElement
+    add_text = _text
+    itype = get("type") or "LABEL"
+    media_tag = _MEDIA_TAGS.get(itype)
+    if media_tag:
+        el = sub(parent_items, media_tag)
+        _attr_keys(el, node, _MEDIA_ATTRS)
+        _set_bool_attr(el, "ownLine", get("ownLine"))
         return
 
-    el = SubElement(parent_items, "item")
-    _attr(el, [
-        ("ref", node.get("ref")),
-        ("type", itype),
-        ("subcategory", node.get("subcategory")),
-        ("x", node.get("x")), ("y", node.get("y")),
-        ("formula", node.get("formula")),
-        ("showIf", node.get("showIf")),
-        ("makeNoteIf", node.get("makeNoteIf")),
-        ("noteIndex", node.get("noteIndex")),
-        ("flag", node.get("flag")),
-        ("negFlag", node.get("negFlag")),
-        ("emrField", node.get("emrField")),
-    ])
-    _set_bool_attr(el, "ownLine", node.get("ownLine"))
-    _set_bool_attr(el, "quoteAnswer", node.get("quoteAnswer"))
-
-    # Authoring fields:
-    # - label -> <c>
-    # - cNote -> <cNote>
-    # - text  -> <text> (prefill or macro/default)
-    if node.get("label"): _text(el, "c", node["label"])
-    if node.get("cNote"): _text(el, "cNote", node["cNote"])
-    if node.get("text"):  _text(el, "text", node["text"])
-
-    if node.get("tooltip"): _text(el, "tooltip", node["tooltip"])
-    if node.get("studyColumnHeader"): _text(el, "studyColumnHeader", node["studyColumnHeader"])
-    if node.get("markableDiagramFileName"): _text(el, "markableDiagramFileName", node["markableDiagramFileName"])
-
-    if node.get("dxCode"):
-        dx = SubElement(el, "dxCode")  # content packed as "code|desc|type"
-        parts = (node["dxCode"] or "").split("|")
-        if len(parts) > 0: dx.set("code", parts[0])
-        if len(parts) > 1: dx.set("desc", parts[1])
-        if len(parts) > 2: dx.set("type", parts[2])
+    el = sub(parent_items, "item")
+    _attr_keys(el, node, _REF_ATTR)
+    el.set("type", itype)  # never empty: defaulted to LABEL above
+    _attr_keys(el, node, _ITEM_ATTRS)
+    for k in _ITEM_BOOL_ATTRS:
+        _set_bool_attr(el, k, get(k))
+
+    # Optional text children; one lookup per key, and _text only for set values.
+    for k, tag in _ITEM_TEXT_TAGS:
+        v = get(k)
+        if v:
+            add_text(el, tag, v)
+
+    if get("dxCode"):
+        dx = sub(el, "dxCode")  # content packed as "code|desc|type"
+        code, sep, rest = node["dxCode"].partition("|")
+        dx.set("code", code)
+        if sep:
+            desc, sep, rest = rest.partition("|")
+            dx.set("desc", desc)
+            if sep:
+                dx.set("type", rest.partition("|")[0])
 
     # validator
-    v = node.get("validator")
-    if v and (v.get("type") or v.get("validIf") or v.get("format") or v.get("message")):
-        vv = SubElement(el, "validator")
-        _attr(vv, [("type", v.get("type")), ("format", v.get("format")), ("message", v.get("message"))])
-        if v.get("allowEmpty") is not None:
-            _set_bool_attr(vv, "allowEmpty", v.get("allowEmpty"))
-        if v.get("validIf"):
-            vv.set("validIf", v.get("validIf"))
+    v = get("validator")
+    if v:
+        vget = v.get
+        if vget("type") or vget("validIf") or vget("format") or vget("message"):
+            vv = sub(el, "validator")
+            _attr_keys(vv, v, _VALIDATOR_ATTRS)
+            if vget("allowEmpty") is not None:
+                _set_bool_attr(vv, "allowEmpty", vget("allowEmpty"))
+            if vget("validIf"):
+                vv.set("validIf", vget("validIf"))
 
     # hints
-    if node.get("hints"):
-        hints = SubElement(el, "hints")
-        for h in node["hints"]:
-            ht = SubElement(hints, "hint")
-            ht.text = h
+    if get("hints"):
+        _hints(el, node["hints"])
 
     # choices
-    if node.get("choices"):
-        chs = SubElement(el, "choices")
+    if get("choices"):
+        chs = sub(el, "choices")
         for c in node["choices"]:
-            ce = SubElement(chs, "choice")
-            # ensure attribute strings
-            points = c.get("points")
-            points_str = str(points) if points is not None and str(points) != "" else None
-            _attr(ce, [("val", c.get("val")), ("points", points_str), ("flag", c.get("flag"))])
-            if c.get("display"): _text(ce, "display", c["display"])
-            if c.get("note"): _text(ce, "note", c["note"])
-
-def _compose_section(parent_items: Element, node: Dict):
-    sec = SubElement(parent_items, "section")
-    attrs = node.get("attributes", {}) or {}
-    _attr(sec, [
-        ("ref", node.get("ref")),
-        ("subcategory", attrs.get("subcategory")),
-        ("headerStyle", attrs.get("headerStyle")),
-        ("expandIf", attrs.get("expandIf")),
-        ("showIf", attrs.get("showIf")),
-        ("makeNoteIf", attrs.get("makeNoteIf")),
-        ("flag", attrs.get("flag")),
-        ("noteIndex", attrs.get("noteIndex")),
-    ])
-    _set_bool_attr(sec, "groupItems", attrs.get("groupItems"))
-    _set_bool_attr(sec, "quoteAnswers", attrs.get("quoteAnswers"))
-    _set_bool_attr(sec, "ownLine", attrs.get("ownLine"))
+            ce = sub(chs, "choice")
+            _attr_keys(ce, c, _CHOICE_ATTRS)  # points may be numeric; stringified like any attribute
+            if c.get("display"): add_text(ce, "display", c["display"])
+            if c.get("note"): add_text(ce, "note", c["note"])
+
+def _compose_section(parent_items: Element, node: Dict) -> Element:
+    """Emit <section> (attributes, caption, hints) and return its empty <items>."""
+    get = node.get
+    sub = SubElement
+    sec = sub(parent_items, "section")
+    attrs = get("attributes") or _EMPTY
+    _attr_keys(sec, node, _REF_ATTR)
+    _attr_keys(sec, attrs, _SECTION_ATTRS)
+    for k in _SECTION_BOOL_ATTRS:
+        _set_bool_attr(sec, k, attrs.get(k))
 
     # Section caption
-    if node.get("header"):
+    if get("header"):
         _text(sec, "c", node["header"])
 
     # hints
-    if node.get("hints"):
-        hints = SubElement(sec, "hints")
-        for h in node["hints"]:
-            ht = SubElement(hints, "hint")
-            ht.text = h
-
-    items = SubElement(sec, "items")
-    for ch in node.get("items", []):
-        if ch.get("kind") == "section":
-            _compose_section(items, ch)
-        elif ch.get("kind") == "item":
-            _compose_item(items, ch)
+    if get("hints"):
+        _hints(sec, node["hints"])
+
+    return sub(sec, "items")
+
+def _compose_sections(parent_items: Element, sections: List[Dict]):
+    """Depth-first over (nested) sections; children are pushed in reverse so each
+    <items> is filled in document order."""
+    stack = [(parent_items, s, "section") for s in reversed(sections)]
+    pop, push = stack.pop, stack.append
+    compose_section, compose_item = _compose_section, _compose_item
+    while stack:
+        parent, node, kind = pop()
+        if kind == "item":
+            compose_item(parent, node)
+            continue
+        items = compose_section(parent, node)
+        for ch in reversed(node.get("items", [])):
+            k = ch.get("kind")
+            if k == "section" or k == "item":
+                push((items, ch, k))
 
-def compose_xml(cir: Dict) -> bytes:
+def _build_tree(cir: Dict) -> Element:
     meta = cir.get("meta", {})
     root = Element("eform")
     _attr(root, [
@@ -160,8 +204,21 @@ def compose_xml(cir: Dict) -> bytes:
     # mainSection
     main = SubElement(root, "mainSection")
     ms_items = SubElement(main, "items")
-    for s in cir.get("sections", []):
-        _compose_section(ms_items, s)
+    _compose_sections(ms_items, cir.get("sections", []))
+
+    return root
 
-    pretty = minidom.parseString(tostring(root, encoding="utf-8")).toprettyxml(indent="  ", encoding="utf-8")
-    return pretty
+def compose_xml(cir: Dict) -> bytes:
+    """
+    Render a CIR as Ocean eForm XML.
+
+    Contract: `cir` has already passed validate_and_normalize_cir (every caller in
+    app.main checks v["ok"] first), so nodes and choices are dicts of the schema's
+    types and the composer loops carry no per-node isinstance guards.
+    """
+    root = _build_tree(cir)
+    # Single serialization pass; no serialize -> reparse -> pretty-print round-trip.
+    if _LXML:
+        return tostring(root, pretty_print=True, xml_declaration=True, encoding="UTF-8")
+    indent(root, space="  ")
+    return tostring(root, encoding="UTF-8", xml_declaration=True) + b"\n"
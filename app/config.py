@@ -1,21 +1,28 @@
 # app/config.py
 import os
+from typing import Tuple
+
+def _csv_env(name: str, default: str = "") -> Tuple[str, ...]:
+    """Comma-separated env var -> tuple of non-empty, stripped entries (immutable, shared)."""
+    return tuple(p.strip() for p in os.getenv(name, default).split(",") if p.strip())
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-5")
 OPENAI_TEMPERATURE = float(os.getenv("OPENAI_TEMPERATURE", "0"))  # let you set 1.0 from env
+# Reuse model output for identical re-submissions (entries, seconds). Opt-in: with the
+# default LLM_CACHE_SIZE=0 every request gets a fresh generation.
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "0"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
 
 # CORS
 # Exact origins (comma-separated). NOTE: wildcards like https://*.webflow.io do NOT work here.
-ALLOWED_ORIGINS = [o.strip() for o in os.getenv("ALLOWED_ORIGINS", "").split(",") if o.strip()]
+ALLOWED_ORIGINS = _csv_env("ALLOWED_ORIGINS")
 # Regex alternative for subdomains, e.g., r"^https://([a-z0-9-]+)\.webflow\.io$"
 ALLOWED_ORIGIN_REGEX = os.getenv("ALLOWED_ORIGIN_REGEX", "")
 # MVP override: allow all origins (no credentials). Safe since we do not use cookies.
 ALLOW_ALL_ORIGINS = os.getenv("ALLOW_ALL_ORIGINS", "0") == "1"
 # Expose headers so your JS can read them (e.g., Content-Disposition for filename)
-EXPOSE_HEADERS = [h.strip() for h in os.getenv(
-    "EXPOSE_HEADERS", "Content-Disposition,X-Service"
-).split(",") if h.strip()]
+EXPOSE_HEADERS = _csv_env("EXPOSE_HEADERS", "Content-Disposition,X-Service")
 
 DEBUG = os.getenv("DEBUG", "0") == "1"
 DEFAULT_NOTE_VERSION = int(os.getenv("DEFAULT_NOTE_VERSION", "2"))
@@ -2,7 +2,8 @@
 
 from __future__ import annotations
 import os, json
-from typing import Dict, Any, List
+from functools import lru_cache
+from typing import Dict, Any, Iterator, List, Tuple
 from app.knowledge_loader import Knowledge, DEFAULT_KNOWLEDGE_DIR
 
 # Where the compressed knowledge lives (you uploaded this under repo root)
@@ -23,41 +24,41 @@ except Exception as e:
 def _take(lst: List[Any], n: int) -> List[Any]:
     return list(lst or [])[:n]
 
-def _emit_bundle_text(bundle: Dict[str, Any], per_type_limit: int = 6) -> str:
-    """
-    Turn a compact bundle into a short, LLM-friendly guidance string.
-    Keep this concise: it's appended to the system message.
-    """
-    lines: List[str] = []
+def _rule_text(r: Any) -> str:
+    return r.get("rule") if isinstance(r, dict) else str(r)
+
+# Hard cap to avoid bloating the system prompt (~12k chars)
+_BUNDLE_TEXT_CAP = 12000
 
+def _bundle_lines(bundle: Dict[str, Any], per_type_limit: int) -> Iterator[str]:
+    """Guidance lines in emission order (joined with newlines by _emit_bundle_text)."""
     acc = _take(bundle.get("acceptance_checks"), 12)
     if acc:
-        lines.append("ACCEPTANCE_CHECKS:")
+        yield "ACCEPTANCE_CHECKS:"
         for a in acc:
-            lines.append(f"- {a}")
+            yield f"- {a}"
 
     sec = bundle.get("section_style") or {}
     derived = _take(sec.get("derived"), 6)
     rules   = _take(sec.get("rules"), 6)
     if derived or rules:
-        lines.append("\nSECTION_STYLE:")
-        for r in derived: lines.append(f"- {r}")
-        for r in rules:   lines.append(f"- {r}")
+        yield "\nSECTION_STYLE:"
+        for r in derived: yield f"- {r}"
+        for r in rules:   yield f"- {r}"
 
     scr = bundle.get("scripting") or {}
     idioms = _take(scr.get("idioms"), 8)
     if idioms:
-        lines.append("\nSCRIPTING_IDIOMS:")
+        yield "\nSCRIPTING_IDIOMS:"
         for i in idioms:
             pat = (i or {}).get("pattern","")
             ex  = (i or {}).get("example") or ""
-            lines.append(f"- {pat}" + (f"  (e.g., {ex})" if ex else ""))
+            yield f"- {pat}" + (f"  (e.g., {ex})" if ex else "")
 
     its: Dict[str,Any] = bundle.get("item_types") or {}
     if its:
-        lines.append("\nITEM_TYPES_GUIDE:")
+        yield "\nITEM_TYPES_GUIDE:"
         for t, g in its.items():
-            lines.append(f"- {t}:")
             req = _take(g.get("required"), per_type_limit)
             rec = _take(g.get("recommended"), max(2, per_type_limit//2))
             anti= _take(g.get("anti_patterns"), max(2, per_type_limit//2))
@@ -65,43 +66,59 @@ def _emit_bundle_text(bundle: Dict[str, Any], per_type_limit: int = 6) -> str:
             hints=_take(g.get("hints_common"), 3)
             ca  = _take(g.get("choice_authoring"), 3)
 
-            for r in req:
-                text = r.get("rule") if isinstance(r, dict) else str(r)
-                lines.append(f"  * MUST: {text}")
-            for r in rec:
-                text = r.get("rule") if isinstance(r, dict) else str(r)
-                lines.append(f"  * SHOULD: {text}")
-            for r in anti:
-                text = r.get("rule") if isinstance(r, dict) else str(r)
-                lines.append(f"  * AVOID: {text}")
-            if vals:
-                lines.append(f"  * VALIDATORS: {', '.join(vals)}")
-            if hints:
-                lines.append(f"  * HINTS: {', '.join(hints)}")
-            if ca:
-                lines.append(f"  * CHOICE_AUTHORING: {', '.join(ca)}")
+            # One pre-joined block per type instead of one append per rule row.
+            yield "\n".join([
+                f"- {t}:",
+                *(f"  * MUST: {_rule_text(r)}" for r in req),
+                *(f"  * SHOULD: {_rule_text(r)}" for r in rec),
+                *(f"  * AVOID: {_rule_text(r)}" for r in anti),
+                *((f"  * VALIDATORS: {', '.join(vals)}",) if vals else ()),
+                *((f"  * HINTS: {', '.join(hints)}",) if hints else ()),
+                *((f"  * CHOICE_AUTHORING: {', '.join(ca)}",) if ca else ()),
+            ])
 
     rn = bundle.get("ref_naming") or {}
     recipes = _take(rn.get("recipes"), 2)
     if recipes:
-        lines.append("\nREF_NAMING:")
+        yield "\nREF_NAMING:"
         for r in recipes:
             if isinstance(r, dict) and r.get("recipe"):
-                lines.append(f"- {r['recipe']}")
+                yield f"- {r['recipe']}"
             elif isinstance(r, str):
-                lines.append(f"- {r}")
+                yield f"- {r}"
 
     macros = _take(bundle.get("macros"), 8)
     if macros:
-        lines.append("\nCOMMON_MACROS:")
+        yield "\nCOMMON_MACROS:"
         for m in macros:
             macro = (m or {}).get('macro','')
             if macro:
-                lines.append(f"- {macro}")
+                yield f"- {macro}"
 
-    text = "\n".join(lines)
-    # Hard cap to avoid bloating the system prompt (~12k chars)
-    return text[:12000]
+def _emit_bundle_text(bundle: Dict[str, Any], per_type_limit: int = 6) -> str:
+    """
+    Turn a compact bundle into a short, LLM-friendly guidance string.
+    Keep this concise: it's appended to the system message.
+    """
+    # Lines are produced lazily; once the joined length reaches the cap the rest
+    # would be sliced off anyway, so stop before formatting it.
+    lines: List[str] = []
+    size = -1  # "\n".join adds len(lines) - 1 separators
+    for line in _bundle_lines(bundle, per_type_limit):
+        lines.append(line)
+        size += len(line) + 1
+        if size >= _BUNDLE_TEXT_CAP:
+            break
+    return "\n".join(lines)[:_BUNDLE_TEXT_CAP]
+
+@lru_cache(maxsize=256)
+def _bundle_text_for(types: Tuple[str, ...]) -> str:
+    """
+    Bundle + render for one predicted type set. The knowledge pack is fixed after
+    import, so this is pure in `types`; different prompts that predict the same
+    types share one entry (bounded by the distinct type sets, not by prompt text).
+    """
+    return _emit_bundle_text(_K.bundle(include_types=list(types)))
 
 # -------- public API used by openai_client --------
 
@@ -120,35 +137,37 @@ OCEAN-STRICT RULES (do not violate):
 - If you add a total score FORMULA, prefer showIf="false" and report the value in <cNote> with $$.
 """.strip()
 
-def build_guidance_block(user_text: str, defaults: Dict) -> str:
-    """
-    Returns a compact, evidence-based guidance block to append to the system prompt.
-    If knowledge pack isn't available, returns a strict fallback so your pipeline still runs.
-    """
-    header = [
+# Static parts of the block, joined once at import; only the selected-types line
+# and the knowledge body vary per request.
+_HEADER = "\n".join([
     "DATA_GUIDANCE:",
     "- Output MUST satisfy CIR_JSON_SCHEMA; fields map 1:1 to Ocean eForm XML.",
     "- Include 'kind' for every node (section/item).",
-    "- Keep refs unique; avoid '|' in choice@val."
+    "- Keep refs unique; avoid '|' in choice@val.",
     "- FORMULA must be a single JavaScript expression (no function/var/let/const/return). Prefer simple arithmetic using .p (e.g., q1.p + q2.p) or ScriptUtil.sum(sectionRef).",
     "- For conditionals, use boolean expressions (e.g., q1.p >= 2) or a nested ternary to produce strings. For bucketed outputs (e.g., severity bands), prefer hidden LABEL items with makeNoteIf or a ternary expression, not function bodies.",
     "- When comparing to strings, use .r (e.g., consentChoice.r == 'Yes'); for numeric arithmetic/thresholds, use .p (e.g., score.p >= 10). Never chain .p/.r (e.g., avoid '.p.p' or '.r.p').",
-    ]
-
+])
+_STRICT_FOOTER = "\n\n" + _OCEAN_STRICT
 
+def build_guidance_block(user_text: str, defaults: Dict) -> str:
+    """
+    Returns a compact, evidence-based guidance block to append to the system prompt.
+    If knowledge pack isn't available, returns a strict fallback so your pipeline still runs.
+    """
     if not _KNOWLEDGE_OK:
-        body = "\n".join([
-            f"(knowledge pack unavailable: {KNOWLEDGE_DIR} — {_KNOWLEDGE_ERR})",
-            _OCEAN_STRICT
-        ])
-        return "\n".join(header) + "\n\n" + body
+        return _FALLBACK_BLOCK
 
     # Predict relevant item types from the user's description, then bundle compact guidance.
     predicted_types = _K.predict_item_types(user_text or "")
-    bundle = _K.bundle(include_types=predicted_types)
-
-    header.append(f"- Selected item types (from request): {', '.join(predicted_types)}")
-    body = _emit_bundle_text(bundle)
+    body = _bundle_text_for(tuple(predicted_types))
 
     # Always append the non-negotiable Ocean rules.
-    return "\n".join(header) + "\n\n" + _OCEAN_STRICT + ("\n\n" + body if body else "")
+    return (
+        f"{_HEADER}\n- Selected item types (from request): {', '.join(predicted_types)}"
+        f"{_STRICT_FOOTER}" + ("\n\n" + body if body else "")
+    )
+
+_FALLBACK_BLOCK = (
+    f"{_HEADER}\n\n(knowledge pack unavailable: {KNOWLEDGE_DIR} — {_KNOWLEDGE_ERR})\n{_OCEAN_STRICT}"
+)
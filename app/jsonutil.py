@@ -0,0 +1,16 @@
+# app/jsonutil.py
+import copy
+from typing import Any
+
+def copy_json(obj: Any) -> Any:
+    """Deep copy of JSON-shaped data: dicts and lists are rebuilt, immutable scalars are
+    shared, so none of copy.deepcopy's per-node memo bookkeeping. Values (NaN/inf, big
+    ints, non-str keys) come through unchanged; any other object goes to deepcopy."""
+    t = type(obj)
+    if t is dict:
+        return {k: copy_json(v) for k, v in obj.items()}
+    if t is list:
+        return [copy_json(v) for v in obj]
+    if t is str or t is int or t is float or t is bool or obj is None:
+        return obj
+    return copy.deepcopy(obj)
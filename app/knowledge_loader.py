@@ -2,9 +2,13 @@
 # Loads compact runtime guidance from knowledge/runtime and builds per-request bundles.
 
 from __future__ import annotations
-import os, json, re
+import os, re
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Tuple
+try:
+    from orjson import loads as _json_loads  # parses bytes directly, no str decode
+except ImportError:  # stdlib json also accepts UTF-8 bytes
+    from json import loads as _json_loads
 
 DEFAULT_KNOWLEDGE_DIR = os.getenv("KNOWLEDGE_DIR", "knowledge/runtime")
 
@@ -29,6 +33,10 @@ _KEYWORDS_MAP = [
     (r"\b(duration|how long|minutes|hours)\b", ["APPROXIMATE_DURATION"]),
     (r"\b(month/year|approximate date|about when)\b", ["APPROXIMATE_DATE"]),
 ]
+# Compiled once. Kept as separate searches: one big alternation is slower under re
+# (no DFA; every branch is tried at every position) and its non-overlapping matches
+# would drop keywords that overlap another (e.g. "how long answer").
+_KEYWORD_RES = [(re.compile(pat), types) for pat, types in _KEYWORDS_MAP]
 
 class Knowledge:
     def __init__(self, base_dir: str = DEFAULT_KNOWLEDGE_DIR):
@@ -49,13 +57,15 @@ class Knowledge:
         if self.itemtypes_dir.exists():
             for p in self.itemtypes_dir.glob("*.json"):
                 try:
-                    d = json.loads(p.read_text(encoding="utf-8"))
+                    d = _json_loads(p.read_bytes())
                     t = str(d.get("type") or p.stem).upper()
                     self.itemtypes[t] = d
                 except Exception:
                     continue
         if not self.itemtypes:
             raise RuntimeError(f"No item type shards found in {self.itemtypes_dir}")
+        # Baseline types we actually have shards for; fixed once the shards are loaded.
+        self._fallback_types: Tuple[str, ...] = tuple(t for t in ITEMTYPE_FALLBACK if t in self.itemtypes)
 
         # Acceptance checks (top list used in prompts)
         self.acceptance_checks: List[str] = list(self.handbook.get("acceptance_checks", []))[:24]
@@ -65,7 +75,7 @@ class Knowledge:
         if not p.exists():
             return {}
         try:
-            return json.loads(p.read_text(encoding="utf-8"))
+            return _json_loads(p.read_bytes())
         except Exception as e:
             raise RuntimeError(f"Failed to load {p}: {e}")
 
@@ -75,26 +85,21 @@ class Knowledge:
     def predict_item_types(self, description: str) -> List[str]:
         """Heuristic: infer likely item types from free-text description."""
         desc = (description or "").lower()
-        found: List[str] = []
-        for pat, types in _KEYWORDS_MAP:
-            if re.search(pat, desc):
-                for t in types:
-                    if t not in found:
-                        found.append(t)
+        found: Dict[str, None] = {}  # ordered set: first hit wins the position
+        for rx, types in _KEYWORD_RES:
+            if rx.search(desc):
+                found.update(dict.fromkeys(types))
         # Always include a practical baseline
-        for t in ITEMTYPE_FALLBACK:
-            if t not in found:
-                found.append(t)
+        found.update(dict.fromkeys(self._fallback_types))
         # Keep only shards we actually have
         return [t for t in found if t in self.itemtypes]
 
     def bundle(self, include_types: List[str] | None = None, extra_acceptance: List[str] | None = None) -> Dict[str, Any]:
         """Build a compact bundle for prompts."""
-        types = include_types or []
-        types = [t.upper() for t in types if t.upper() in self.itemtypes]
+        itemtypes = self.itemtypes
+        types = [u for u in (t.upper() for t in include_types or ()) if u in itemtypes]
         if not types:
-            types = ITEMTYPE_FALLBACK
-            types = [t for t in types if t in self.itemtypes]
+            types = self._fallback_types
 
         itemtype_guides = {t: self.itemtypes[t] for t in types}
         acc = list(self.acceptance_checks)
@@ -1,8 +1,14 @@
 # app/main.py
-import io, json, logging
-from fastapi import FastAPI, File, Form, UploadFile
+import json, logging
+from typing import Any, Dict
+from fastapi import Depends, FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import PlainTextResponse, StreamingResponse, JSONResponse
+from fastapi.responses import Response, JSONResponse
+try:
+    import orjson
+except ImportError:  # optional accelerator; stdlib json via Starlette otherwise
+    orjson = None
 from app.config import (
     ALLOWED_ORIGINS, ALLOWED_ORIGIN_REGEX, ALLOW_ALL_ORIGINS,
     EXPOSE_HEADERS, DEBUG, SERVICE_NAME
@@ -15,7 +21,46 @@ from app.normalizers_soft import soft_repair_cir  # <-- NEW
 
 log = logging.getLogger("uvicorn.error")
 
-app = FastAPI(title="Ocean eForm Builder", version="0.2.1")
+if orjson is not None:
+    class FastJSONResponse(JSONResponse):
+        """JSONResponse rendered by orjson (same compact UTF-8 output, much faster on big CIRs)."""
+        def render(self, content: Any) -> bytes:
+            return orjson.dumps(content)
+    _json_loads = orjson.loads
+else:
+    FastJSONResponse = JSONResponse
+    _json_loads = json.loads
+
+# CIR bodies are parsed here rather than declared as `cir: dict`, so large payloads
+# skip stdlib json + pydantic's dict copy; the OpenAPI entry still shows a JSON object.
+_CIR_BODY_DOC = {"requestBody": {"required": True, "content": {"application/json": {"schema": {"type": "object"}}}}}
+
+async def _cir_body(request: Request) -> Dict:
+    # Errors keep the shape FastAPI gave a `cir: dict` body: 422 with a list detail.
+    body = await request.body()
+    cir = None
+    if body:
+        try:
+            cir = _json_loads(body)
+        except ValueError:
+            # orjson rejects some input the stdlib accepts (NaN/Infinity, 1e400, lone
+            # surrogates); the stdlib parser has the final say, as it did before.
+            try:
+                cir = json.loads(body)
+            except json.JSONDecodeError as e:
+                raise RequestValidationError([{
+                    "type": "json_invalid", "loc": ("body", e.pos), "msg": "JSON decode error",
+                    "input": {}, "ctx": {"error": e.msg},
+                }], body=e.doc)
+            except ValueError:  # undecodable bytes
+                raise HTTPException(status_code=400, detail="There was an error parsing the body")
+    if cir is None:  # empty body or a JSON null
+        raise RequestValidationError([{"type": "missing", "loc": ("body",), "msg": "Field required", "input": None}])
+    if not isinstance(cir, dict):
+        raise RequestValidationError([{"type": "dict_type", "loc": ("body",), "msg": "Input should be a valid dictionary", "input": cir}])
+    return cir
+
+app = FastAPI(title="Ocean eForm Builder", version="0.2.1", default_response_class=FastJSONResponse)
 
 cors_kwargs = dict(
     allow_credentials=False,
@@ -29,20 +74,22 @@ if ALLOW_ALL_ORIGINS:
 elif ALLOWED_ORIGIN_REGEX:
     cors_kwargs["allow_origin_regex"] = ALLOWED_ORIGIN_REGEX
 else:
-    cors_kwargs["allow_origins"] = ALLOWED_ORIGINS or ["*"]
+    cors_kwargs["allow_origins"] = ALLOWED_ORIGINS or ("*",)
 app.add_middleware(CORSMiddleware, **cors_kwargs)
 
 @app.get("/health", tags=["meta"])
 def health():
     return {"ok": True, "service": SERVICE_NAME}
 
-def _xml_stream(xml_bytes: bytes, filename: str, issues_count: int = 0) -> StreamingResponse:
+def _xml_download(xml_bytes: bytes, filename: str, issues_count: int = 0) -> Response:
+    # The document is already complete bytes: send it in one body with a
+    # Content-Length rather than as a chunked stream over a BytesIO.
     headers = {
         "Content-Disposition": f'attachment; filename="{filename}"',
         "X-Service": SERVICE_NAME,
         "X-Issues-Count": str(issues_count),
     }
-    return StreamingResponse(io.BytesIO(xml_bytes), media_type="application/xml", headers=headers)
+    return Response(content=xml_bytes, media_type="application/xml", headers=headers)
 
 @app.post("/v1/create-from-description-xml", tags=["mvp"])
 async def create_from_description_xml(
@@ -53,20 +100,20 @@ async def create_from_description_xml(
     dataSecurityMode: str = Form("encrypted"),
 ):
     defaults = {"meta": {"title": title, "ref": ref, "noteVersion": 2, "noteType": noteType, "dataSecurityMode": dataSecurityMode}}
-    cir, _raw = cir_from_description(description, defaults)
+    cir, _raw = await cir_from_description(description, defaults)
 
     # Soft repair BEFORE validation
-    cir = soft_repair_cir(cir)
+    cir = soft_repair_cir(cir, in_place=True)
 
     v = validate_and_normalize_cir(cir)
     if not v["ok"]:
         payload = {"ok": False, "issues": v["issues"], "cir": v.get("cir", {})}
         log.error("Validation failed /v1/create-from-description-xml: %s", json.dumps(payload, ensure_ascii=False))
-        return JSONResponse(payload, status_code=400)
+        return FastJSONResponse(payload, status_code=400)
 
     xml_bytes = compose_xml(v["cir"])
     filename = f"{v['cir']['meta'].get('ref','form')}.xml"
-    return _xml_stream(xml_bytes, filename, issues_count=len(v["issues"]))
+    return _xml_download(xml_bytes, filename, issues_count=len(v["issues"]))
 
 @app.post("/v1/create-from-pdf-xml", tags=["mvp"])
 async def create_from_pdf_xml(
@@ -76,35 +123,38 @@ async def create_from_pdf_xml(
     noteType: str = Form("progress"),
     dataSecurityMode: str = Form("encrypted"),
 ):
-    pdf_bytes = await file.read()
-    pdf_text, _pages = extract_outline_from_pdf(pdf_bytes, file.filename)
+    # Starlette already spooled the upload to a SpooledTemporaryFile (disk past 1 MB);
+    # let pypdf read it in place instead of materializing it with file.read().
+    await file.seek(0)
+    pdf_text, _pages = extract_outline_from_pdf(file.file, file.filename)
     defaults = {"meta": {"title": title, "ref": ref, "noteVersion": 2, "noteType": noteType, "dataSecurityMode": dataSecurityMode}}
-    cir, _raw = cir_from_pdf_text(pdf_text, defaults)
+    cir, _raw = await cir_from_pdf_text(pdf_text, defaults)
 
     # Soft repair BEFORE validation
-    cir = soft_repair_cir(cir)
+    cir = soft_repair_cir(cir, in_place=True)
 
     v = validate_and_normalize_cir(cir)
     if not v["ok"]:
         payload = {"ok": False, "issues": v["issues"], "cir": v.get("cir", {})}
         log.error("Validation failed /v1/create-from-pdf-xml: %s", json.dumps(payload, ensure_ascii=False))
-        return JSONResponse(payload, status_code=400)
+        return FastJSONResponse(payload, status_code=400)
 
     xml_bytes = compose_xml(v["cir"])
     filename = f"{v['cir']['meta'].get('ref','form')}.xml"
-    return _xml_stream(xml_bytes, filename, issues_count=len(v["issues"]))
+    return _xml_download(xml_bytes, filename, issues_count=len(v["issues"]))
 
-@app.post("/v1/compose-xml", tags=["programmatic"])
-async def compose_xml_endpoint(cir: dict):
-    v = validate_and_normalize_cir(soft_repair_cir(cir))
+@app.post("/v1/compose-xml", tags=["programmatic"], openapi_extra=_CIR_BODY_DOC)
+async def compose_xml_endpoint(cir: Dict = Depends(_cir_body)):
+    v = validate_and_normalize_cir(soft_repair_cir(cir, in_place=True))
     if not v["ok"]:
         payload = {"ok": False, "issues": v["issues"], "cir": v.get("cir", {})}
         log.error("Validation failed /v1/compose-xml: %s", json.dumps(payload, ensure_ascii=False))
-        return JSONResponse(payload, status_code=400)
+        return FastJSONResponse(payload, status_code=400)
     xml_bytes = compose_xml(v["cir"])
-    return PlainTextResponse(xml_bytes.decode("utf-8"), media_type="application/xml", headers={"X-Issues-Count": str(len(v["issues"]))})
+    return Response(content=xml_bytes, media_type="application/xml", headers={"X-Issues-Count": str(len(v["issues"]))})
 
-@app.post("/v1/validate-cir", tags=["programmatic"])
-async def validate_cir_endpoint(cir: dict):
-    v = validate_and_normalize_cir(soft_repair_cir(cir))
-    return {"ok": v["ok"], "issues": v["issues"], "cir": v["cir"]}
+@app.post("/v1/validate-cir", tags=["programmatic"], openapi_extra=_CIR_BODY_DOC)
+async def validate_cir_endpoint(cir: Dict = Depends(_cir_body)):
+    v = validate_and_normalize_cir(soft_repair_cir(cir, in_place=True))
+    # Returned as a response object so FastAPI skips jsonable_encoder over the whole CIR.
+    return FastJSONResponse({"ok": v["ok"], "issues": v["issues"], "cir": v["cir"]})
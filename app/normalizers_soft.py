@@ -1,7 +1,10 @@
 # app/normalizers_soft.py
 from __future__ import annotations
 import re, json, copy, logging
-from typing import Dict, List, Any, Optional, Set, Tuple  # <-- add Set, Tuple
+from functools import lru_cache
+from typing import AbstractSet, Dict, FrozenSet, List, Any, Optional, Set, Tuple  # <-- add Set, Tuple
+from app.enums import ITEM_TYPES
+from app.jsonutil import copy_json
 
 log = logging.getLogger("uvicorn.error")
 
@@ -21,133 +24,175 @@ JS_KEYWORDS = {
     "String","Number","Boolean","Array","Object","Date","RegExp","JSON"
 }
 
+# Expression-repair patterns, compiled once (used on every showIf/makeNoteIf/formula)
+_EQ_SINGLE      = re.compile(r'(?<![!<>=])=(?!=)')                 # lone "=" -> "=="
+_CURLY_REF      = re.compile(r'\{ *([A-Za-z_]\w*) *\}')             # {q1} -> q1
+_FUNCTIONY      = re.compile(r'\bfunction\b|=>')
+_SUM_CALL       = re.compile(r'(?<!ScriptUtil\.)\bSUM\s*\(\s*([^)]+?)\s*\)', re.IGNORECASE)
+_SCRIPTUTIL_SUM = re.compile(r'(?i)(?:ScriptUtil\.)+(sum\s*\()')     # collapse repeated prefixes
+_STR_CMP        = re.compile(r'(\b[A-Za-z_]\w*\b)\s*(==|!=)\s*([\'"][^\'"]+[\'"])')
+_NUM_CMP        = re.compile(r'(\b[A-Za-z_]\w*\b)\s*(>=|<=|>|<)\s*([0-9]+(?:\.[0-9]+)?)')
+_ARITH_OP       = re.compile(r'[\+\-/*]')
+_DOT_PR         = re.compile(r'\.(p|r)\b')                          # already .p/.r qualified
+_BRACES         = re.compile(r'^\{|\}$')
+_BARE_WORD      = re.compile(r'\b\w+\b(?!\s*\.(?:p|r))')              # token not already .p/.r
+_WORD           = re.compile(r'\w+')
+
 def _collect_refs(sections: List[Dict]) -> Tuple[Set[str], Set[str]]:
     """Collect item refs and section refs before normalization."""
     item_refs: Set[str] = set()
     section_refs: Set[str] = set()
 
-    def walk_section(sec: Dict):
-        if not isinstance(sec, Dict): return
+    stack = [s for s in sections or [] if isinstance(s, dict)]
+    while stack:
+        sec = stack.pop()
         # section ref
         s_ref = sec.get("ref")
         if isinstance(s_ref, str) and s_ref.strip():
             section_refs.add(s_ref.strip())
         # items
-        kids = sec.get("items") or []
-        for ch in kids:
-            if not isinstance(ch, Dict): 
+        for ch in sec.get("items") or []:
+            if not isinstance(ch, dict):
                 continue
             # Consider it a nested section if it has 'items' but no explicit 'type'
             if (ch.get("kind") == "section") or ("items" in ch and not ch.get("type")):
-                walk_section(ch)
+                stack.append(ch)
             else:
                 i_ref = ch.get("ref")
                 if isinstance(i_ref, str) and i_ref.strip():
                     item_refs.add(i_ref.strip())
 
-    for s in sections or []:
-        if isinstance(s, Dict):
-            walk_section(s)
-
     return item_refs, section_refs
 
-def _fix_expression(expr: str, item_refs: Optional[Set[str]] = None, section_refs: Optional[Set[str]] = None) -> str:
+def _is_dotted(ref: str) -> bool:
+    """Already .p/.r qualified? Almost every ref has no '.', so skip the regex then."""
+    return "." in ref and _DOT_PR.search(ref) is not None
+
+@lru_cache(maxsize=64)
+def _non_word_refs(item_refs: FrozenSet[str]) -> Tuple[str, ...]:
+    """Refs _BARE_WORD can't see as one token, longest first."""
+    return tuple(sorted((r for r in item_refs if not _WORD.fullmatch(r)), key=len, reverse=True))
+
+def _sum_call_to_expr(inside: str, item_refs: AbstractSet[str], section_refs: AbstractSet[str]) -> str:
+    """
+    Rewrite the argument list of a SUM(...) call:
+      - SUM(sectionRef)  -> ScriptUtil.sum(sectionRef)
+      - SUM(a,b,...)     -> (a.p + b.p + ...)
+    """
+    args = [a.strip() for a in inside.split(',') if a.strip()]
+    if len(args) == 1:
+        ref = _BRACES.sub('', args[0])
+        if ref in section_refs:
+            return f"ScriptUtil.sum({ref})"
+        # single item -> item.p (if known)
+        return (f"{ref}.p" if ref in item_refs and not _is_dotted(ref) else ref)
+    # multiple args -> numeric sum of points for known item refs; leave others as-is
+    terms = []
+    for a in args:
+        a_stripped = _BRACES.sub('', a)
+        if a_stripped in item_refs and not _is_dotted(a_stripped):
+            terms.append(f"{a_stripped}.p")
+        else:
+            terms.append(a_stripped)
+    return "(" + " + ".join(terms) + ")"
+
+def _fix_expression(expr: str, item_refs: Optional[AbstractSet[str]] = None, section_refs: Optional[AbstractSet[str]] = None) -> str:
     """Heuristic repairs for Ocean eForm scripting with awareness of known refs."""
-    s = (expr or "").strip()
+    # Pass frozensets (soft_repair_cir does) to skip the per-call conversion.
+    if type(item_refs) is not frozenset:
+        item_refs = frozenset(item_refs or ())
+    if type(section_refs) is not frozenset:
+        section_refs = frozenset(section_refs or ())
+    return _fix_expression_cached(expr or "", item_refs, section_refs)
+
+@lru_cache(maxsize=4096)
+def _fix_expression_cached(expr: str, item_refs: FrozenSet[str], section_refs: FrozenSet[str]) -> str:
+    """
+    Pure kernel of _fix_expression. Forms repeat the same showIf/makeNoteIf/formula
+    strings, so results are cached per (expr, item_refs, section_refs); frozensets
+    cache their hash, so the key costs little after the first lookup.
+    """
+    s = expr.strip()
     if not s:
         return s
 
-    item_refs = item_refs or set()
-    section_refs = section_refs or set()
+    # Each pass below is gated on a character its pattern cannot match without, so
+    # already-clean expressions (the common case) mostly skip the regex engine.
 
     # 1) trivial safe fixes
     # single '=' (not part of ==, >=, <=, !=) -> '=='
-    s = re.sub(r'(?<![!<>=])=(?!=)', '==', s)
+    has_eq = "=" in s
+    if has_eq:
+        s = _EQ_SINGLE.sub('==', s)
 
     # '{ref}' -> 'ref'
-    s = re.sub(r'\{ *([A-Za-z_]\w*) *\}', r'\1', s)
+    if "{" in s:
+        s = _CURLY_REF.sub(r'\1', s)
 
     # detect function-like content; if present, be very conservative
-    has_functiony = bool(re.search(r'\bfunction\b|=>', s))
-
-    # 2) SUM(...) support
-    #    - SUM(sectionRef)  -> ScriptUtil.sum(sectionRef)
-    #    - SUM(a,b,...)     -> a.p + b.p + ...
-    def repl_sum(m):
-        inside = m.group(1)
-        args = [a.strip() for a in inside.split(',') if a.strip()]
-        if len(args) == 1:
-            ref = re.sub(r'^\{|\}$', '', args[0])
-            if ref in section_refs:
-                return f"ScriptUtil.sum({ref})"
-            # single item -> item.p (if known)
-            return (f"{ref}.p" if ref in item_refs and not re.search(r'\.(p|r)\b', ref) else ref)
-        # multiple args -> numeric sum of points for known item refs; leave others as-is
-        terms = []
-        for a in args:
-            a_stripped = re.sub(r'^\{|\}$', '', a)
-            if a_stripped in item_refs and not re.search(r'\.(p|r)\b', a_stripped):
-                terms.append(f"{a_stripped}.p")
-            else:
-                terms.append(a_stripped)
-        return "(" + " + ".join(terms) + ")"
-    s = re.sub(r'\bSUM\s*\(\s*([^)]+?)s = re.sub(r'(?<!ScriptUtil\.)\bSUM\s*\(\s*([^)]+?)\s*\)', repl_sum, s, flags=re.IGNORECASE)
-    s = re.sub(r'(?i)(?:ScriptUtil\.)+(sum\s*\()', r'ScriptUtil.\1', s)\s*\)', repl_sum, s, flags=re.IGNORECASE)
+    has_functiony = ("function" in s or "=>" in s) and bool(_FUNCTIONY.search(s))
+
+    # 2) SUM(...) support (see _sum_call_to_expr)
+    if "(" in s:
+        s = _SUM_CALL.sub(lambda m: _sum_call_to_expr(m.group(1), item_refs, section_refs), s)
+        s = _SCRIPTUTIL_SUM.sub(r'ScriptUtil.\1', s)
 
     # 3) Comparisons
     # strings: left == "foo" => left.r == "foo" (only if left is a known item ref)
     def _left_str_cmp(m):
         left, op, rhs = m.group(1), m.group(2), m.group(3)
-        if left in item_refs and not re.search(r'\.(p|r)\b', left):
+        if left in item_refs:  # left is a bare \w+ token, never already dotted
             return f"{left}.r {op} {rhs}"
         return f"{left} {op} {rhs}"
-    s = re.sub(
-        r'(\b[A-Za-z_]\w*\b)\s*(==|!=)\s*([\'"][^\'"]+[\'"])',
-        _left_str_cmp,
-        s
-    )
+    if has_eq and ("'" in s or '"' in s):
+        s = _STR_CMP.sub(_left_str_cmp, s)
 
     # numeric: left > 3 => left.p > 3 (only if left is a known item ref)
     def _left_num_cmp(m):
         left, op, rhs = m.group(1), m.group(2), m.group(3)
-        if left in item_refs and not re.search(r'\.(p|r)\b', left):
+        if left in item_refs:
             return f"{left}.p {op} {rhs}"
         return f"{left} {op} {rhs}"
-    s = re.sub(
-        r'(\b[A-Za-z_]\w*\b)\s*(>=|<=|>|<)\s*([0-9]+(?:\.[0-9]+)?)',
-        _left_num_cmp,
-        s
-    )
+    if "<" in s or ">" in s:
+        s = _NUM_CMP.sub(_left_num_cmp, s)
 
     # 4) Arithmetic over bare refs: only when NOT function-like, and only for known item refs
-    if (not has_functiony) and re.search(r'[\+\-/*]', s):
-        # Replace bare occurrences of known refs not already dotted
-        # Sort by length to avoid partial replacements (e.g., q1 before q10)
-        for ref in sorted(item_refs, key=len, reverse=True):
-            # match whole word ref, not followed by .p/.r
+    if (not has_functiony) and item_refs and _ARITH_OP.search(s):
+        # One pass over whole-word tokens not followed by .p/.r: known item refs get .p.
+        s = _BARE_WORD.sub(lambda m: m.group(0) + ".p" if m.group(0) in item_refs else m.group(0), s)
+        # Legacy per-ref pass, only for refs that aren't plain \w+ words (rare; these
+        # are renamed by validation anyway). Longest first to avoid partial replacements.
+        for ref in _non_word_refs(item_refs):
             s = re.sub(fr'\b{re.escape(ref)}\b(?!\s*\.(?:p|r))', f"{ref}.p", s)
 
     return s
 
-def _move_section_root_attrs_to_attributes(sec: Dict[str, Any]) -> None:
-    a = sec.setdefault("attributes", {})
-    for key in ("subcategory","headerStyle","expandIf","showIf","makeNoteIf","flag","noteIndex"):
-        if key in sec and key not in ("items","kind","ref","attributes"):
-            val = sec.pop(key, None)
+# Section keys the model sometimes emits at the root instead of under "attributes";
+# (key, cast to bool). None of them collide with the structural keys (items/kind/ref).
+_SECTION_ROOT_ATTRS = (
+    ("subcategory", False), ("headerStyle", False), ("expandIf", False), ("showIf", False),
+    ("makeNoteIf", False), ("flag", False), ("noteIndex", False),
+    ("groupItems", True), ("quoteAnswers", True), ("ownLine", True),
+)
+
+def _move_section_root_attrs_to_attributes(sec: Dict[str, Any], a: Dict[str, Any]) -> None:
+    """Move root-level section attributes into `a` (the section's "attributes" dict)."""
+    for key, as_bool in _SECTION_ROOT_ATTRS:
+        if key in sec:
+            val = sec.pop(key)
             if val is not None:
-                a[key] = val
-    for key in ("groupItems","quoteAnswers","ownLine"):
-        if key in sec and key not in ("items","kind","ref","attributes"):
-            val = sec.pop(key, None)
-            if val is not None:
-                a[key] = bool(val)
+                a[key] = bool(val) if as_bool else val
 
 def _looks_like_prefill(text: str) -> bool:
-    return bool(re.search(r'@pt|@ptCpp|@pt[A-Z]|ScriptUtil', text or ""))
+    # '@pt' already covers '@ptCpp' / '@pt[A-Z]', so two substring probes suffice
+    return bool(text) and ("@pt" in text or "ScriptUtil" in text)
 
 def _normalize_item(x: Dict[str, Any], item_refs: Set[str], section_refs: Set[str]) -> None:
     x["kind"] = "item"
-    x["type"] = (x.get("type") or "LABEL").upper()
+    t = x.get("type") or "LABEL"
+    if t not in ITEM_TYPES:  # canonical (already upper-case) types skip .upper()
+        t = t.upper()
+    x["type"] = t
 
     # Promote <text> -> label (<c>) when it's a patient-facing prompt
     label = x.get("label")
@@ -193,48 +238,57 @@ def _normalize_item(x: Dict[str, Any], item_refs: Set[str], section_refs: Set[st
         if isinstance(x.get(cond_key), str):
             x[cond_key] = _fix_expression(x[cond_key], item_refs, section_refs)
 
-def _walk_section(sec: Dict[str, Any], item_refs: Set[str], section_refs: Set[str]) -> None:
-    sec["kind"] = "section"
-    _move_section_root_attrs_to_attributes(sec)
-
-    attrs = sec.setdefault("attributes", {})
-    if "subcategory" not in attrs:
-        attrs["subcategory"] = "QUESTIONNAIRE"
-
-    # section-level conditions
-    for k in ("showIf","makeNoteIf"):
-        if isinstance(attrs.get(k), str):
-            attrs[k] = _fix_expression(attrs[k], item_refs, section_refs)
-
-    items = sec.get("items")
-    if not isinstance(items, list):
-        sec["items"] = []
-        return
-    for ch in items:
-        if not isinstance(ch, dict):
+def _walk_section(root: Dict[str, Any], item_refs: Set[str], section_refs: Set[str]) -> None:
+    """Normalize a section and everything nested in it."""
+    stack = [root]
+    while stack:
+        sec = stack.pop()
+        sec["kind"] = "section"
+        attrs = sec.setdefault("attributes", {})
+        _move_section_root_attrs_to_attributes(sec, attrs)
+        if "subcategory" not in attrs:
+            attrs["subcategory"] = "QUESTIONNAIRE"
+
+        # section-level conditions
+        for k in ("showIf","makeNoteIf"):
+            if isinstance(attrs.get(k), str):
+                attrs[k] = _fix_expression(attrs[k], item_refs, section_refs)
+
+        items = sec.get("items")
+        if not isinstance(items, list):
+            sec["items"] = []
             continue
-        k = ch.get("kind")
-        if k == "section" or ("items" in ch and "type" not in ch):
-            ch["kind"] = "section"
-            _walk_section(ch, item_refs, section_refs)
-        else:
-            _normalize_item(ch, item_refs, section_refs)
+        for ch in items:
+            if not isinstance(ch, dict):
+                continue
+            k = ch.get("kind")
+            if k == "section" or ("items" in ch and "type" not in ch):
+                stack.append(ch)  # each node is fixed independently; visit order is irrelevant
+            else:
+                _normalize_item(ch, item_refs, section_refs)
+
+_DEFAULT_META = {"noteVersion": 2, "noteType": "progress", "dataSecurityMode": "encrypted"}
 
-def soft_repair_cir(cir: Dict[str, Any]) -> Dict[str, Any]:
-    """Best-effort, conservative repairs with ref-aware scripting fixes."""
-    data = copy.deepcopy(cir or {})
+def soft_repair_cir(cir: Dict[str, Any], in_place: bool = False) -> Dict[str, Any]:
+    """
+    Best-effort, conservative repairs with ref-aware scripting fixes.
+    in_place=True repairs and returns the caller's dict instead of a copy.
+    """
+    data = (cir if cir is not None else {}) if in_place else copy_json(cir or {})
     meta = data.setdefault("meta", {})
-    meta.setdefault("noteVersion", 2)
-    meta.setdefault("noteType", "progress")
-    meta.setdefault("dataSecurityMode", "encrypted")
+    for k, v in _DEFAULT_META.items():
+        if k not in meta:
+            meta[k] = v
 
-    # Ensure sections present
-    secs = data.setdefault("sections", [])
+    # Ensure sections present (a missing, null or empty list gets one default section)
+    secs = data.get("sections")
     if not secs:
-        secs.append({"kind":"section","ref":"__section","attributes":{"subcategory":"QUESTIONNAIRE"},"items":[]})
+        secs = data["sections"] = [{"kind":"section","ref":"__section","attributes":{"subcategory":"QUESTIONNAIRE"},"items":[]}]
 
-    # Collect refs BEFORE normalization (so we know what to dot-qualify)
+    # Collect refs BEFORE normalization (so we know what to dot-qualify); frozen so
+    # every _fix_expression call below shares one hashable, cache-friendly key.
     item_refs, section_refs = _collect_refs(secs)
+    item_refs, section_refs = frozenset(item_refs), frozenset(section_refs)
 
     # Normalize with ref-aware expression fixes
     for s in secs:
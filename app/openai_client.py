@@ -1,19 +1,51 @@
+import hashlib
 import json
 import re
-from typing import Dict, Tuple
-from openai import OpenAI, APIError
-from app.config import OPENAI_API_KEY, OPENAI_MODEL, OPENAI_TEMPERATURE
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+try:
+    import orjson
+except ImportError:  # optional accelerator; stdlib json otherwise
+    orjson = None
+from openai import AsyncOpenAI, APIError, DefaultAsyncHttpxClient
+from app.config import OPENAI_API_KEY, OPENAI_MODEL, OPENAI_TEMPERATURE, LLM_CACHE_SIZE, LLM_CACHE_TTL
 from app.cir_schema import CIR_JSON_SCHEMA
 from app.guidance import build_guidance_block
 from app.repair import auto_repair_cir, AUTO_REPAIR_ENABLED
+from app.jsonutil import copy_json
 
 import os
+from importlib.util import find_spec
 _client = None
+_HAS_H2 = find_spec("h2") is not None  # httpx's HTTP/2 support needs it
 
-def _get_client() -> OpenAI:
+if orjson is not None:
+    _json_loads = orjson.loads
+    def _json_dumps(o) -> str:
+        return orjson.dumps(o).decode()  # UTF-8, so non-ASCII stays as-is (ensure_ascii=False)
+else:
+    _json_loads = json.loads
+    def _json_dumps(o) -> str:
+        return json.dumps(o, ensure_ascii=False)
+
+# Built once: the structured-output wrapper and the schema text for the json_object fallback
+_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "ocean_cir", "schema": CIR_JSON_SCHEMA, "strict": True}
+}
+_JSON_OBJECT_FORMAT = {"type": "json_object"}
+_SCHEMA_JSON = json.dumps(CIR_JSON_SCHEMA)
+
+def _get_client() -> AsyncOpenAI:
+    # Async client: the routes await the model round-trip instead of blocking the event loop
     global _client
     if _client is None:
-        _client = OpenAI(api_key=OPENAI_API_KEY)
+        # One long-lived client, so its keep-alive pool is reused across requests; with
+        # h2 installed (httpx[http2] in requirements.txt), calls are multiplexed over
+        # HTTP/2 as well. Without it the SDK's default HTTP/1.1 client is used.
+        http_client = DefaultAsyncHttpxClient(http2=True) if _HAS_H2 else None
+        _client = AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=http_client)
     return _client
 
 USE_DATA_GUIDANCE = os.getenv("USE_DATA_GUIDANCE", "1") == "1"  # default ON
@@ -32,30 +64,38 @@ STRICT authoring rules (Ocean-specific):
 - The first top-level section must map to subcategory='QUESTIONNAIRE' in XML (the pipeline will set this).
 - Keep output minimal; omit null/empty fields."""
 
+_FENCE_RE = re.compile(r"^```(?:json)?\s*(.*?)\s*```$", re.DOTALL | re.IGNORECASE)
+
 def _strip_json_fences(s: str) -> str:
     if not s: return s
     s = s.strip()
-    m = re.match(r"^```(?:json)?\s*(.*?)\s*```$", s, flags=re.DOTALL | re.IGNORECASE)
+    if not s.startswith("```"):  # structured outputs are usually bare JSON
+        return s
+    m = _FENCE_RE.match(s)
     return m.group(1).strip() if m else s
 
-def _chat_with_schema(messages, schema: Dict) -> Dict:
+async def _chat_with_schema(messages, schema: Dict) -> Dict:
     client = _get_client()
-    response_format = {
-        "type": "json_schema",
-        "json_schema": {"name": "ocean_cir", "schema": schema, "strict": True}
-    }
+    if schema is CIR_JSON_SCHEMA:
+        response_format, schema_json = _RESPONSE_FORMAT, _SCHEMA_JSON
+    else:
+        response_format = {
+            "type": "json_schema",
+            "json_schema": {"name": "ocean_cir", "schema": schema, "strict": True}
+        }
+        schema_json = json.dumps(schema)
     try:
-        resp = client.chat.completions.create(
+        resp = await client.chat.completions.create(
             model=OPENAI_MODEL,
             messages=messages,
             response_format=response_format,
             temperature=OPENAI_TEMPERATURE,
         )
         txt = resp.choices[0].message.content
-        return json.loads(_strip_json_fences(txt))
+        return _json_loads(_strip_json_fences(txt))
     except APIError as e:
         if getattr(e, "status_code", None) in (400, 404) or "response_format" in str(e):
-            resp = client.chat.completions.create(
+            resp = await client.chat.completions.create(
                 model=OPENAI_MODEL,
                 messages=[
                     messages[0],
@@ -64,15 +104,15 @@ def _chat_with_schema(messages, schema: Dict) -> Dict:
                         "content": (
                             "Return ONLY valid JSON that adheres to this JSON Schema. "
                             "Do not include any explanation or code fences.\n\n"
-                            f"JSON Schema:\n{json.dumps(schema)}\n\n"
+                            f"JSON Schema:\n{schema_json}\n\n"
                             f"Task:\n{messages[-1]['content']}"
                         ),
                     },
                 ],
-                response_format={"type": "json_object"},
+                response_format=_JSON_OBJECT_FORMAT,
                 temperature=OPENAI_TEMPERATURE,
             )
-            return json.loads(_strip_json_fences(resp.choices[0].message.content))
+            return _json_loads(_strip_json_fences(resp.choices[0].message.content))
         raise
 
 def _system_with_guidance(user_text: str, defaults: Dict) -> str:
@@ -81,24 +121,69 @@ def _system_with_guidance(user_text: str, defaults: Dict) -> str:
     block = build_guidance_block(user_text, defaults)
     return BASE_SYSTEM + "\n\n" + block
 
-def cir_from_description(description: str, defaults: Dict) -> Tuple[Dict, str]:
+# LRU of final CIRs keyed by a hash of the inputs. A private copy is stored, and each
+# hit returns another one, because the routes repair the returned CIR in place. An
+# exact copy, not serialized text: orjson would write NaN/inf as null.
+_llm_cache: "OrderedDict[str, Tuple[float, Dict, str]]" = OrderedDict()
+
+def _cache_key(kind: str, text: str, defaults: Dict) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for part in (OPENAI_MODEL, kind, text, json.dumps(defaults, sort_keys=True)):
+        h.update(part.encode("utf-8", "surrogatepass"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+def _cache_get(key: str) -> Optional[Tuple[Dict, str]]:
+    hit = _llm_cache.get(key)
+    if hit is None:
+        return None
+    stamp, cir, raw = hit
+    if time.monotonic() - stamp > LLM_CACHE_TTL:
+        del _llm_cache[key]
+        return None
+    _llm_cache.move_to_end(key)
+    return copy_json(cir), raw
+
+def _cache_put(key: str, cir: Dict, raw: str) -> None:
+    if LLM_CACHE_SIZE <= 0:
+        return
+    _llm_cache[key] = (time.monotonic(), copy_json(cir), raw)
+    _llm_cache.move_to_end(key)
+    while len(_llm_cache) > LLM_CACHE_SIZE:
+        _llm_cache.popitem(last=False)
+
+async def cir_from_description(description: str, defaults: Dict) -> Tuple[Dict, str]:
+    key = _cache_key("description", description, defaults)
+    hit = _cache_get(key)
+    if hit is not None:
+        return hit
     system = _system_with_guidance(description, defaults)
     messages = [
         {"role": "system", "content": system},
         {"role": "user", "content": f"Defaults: {json.dumps(defaults)}\n\nDescription:\n{description.strip()}"},
     ]
-    cir = _chat_with_schema(messages, CIR_JSON_SCHEMA)
+    cir = await _chat_with_schema(messages, CIR_JSON_SCHEMA)
     if AUTO_REPAIR_ENABLED:
-        cir = auto_repair_cir(cir)
-    return cir, json.dumps(cir, ensure_ascii=False)
+        cir = auto_repair_cir(cir, in_place=True)  # freshly parsed, nothing else holds it
+    raw = _json_dumps(cir)
+    _cache_put(key, cir, raw)
+    return cir, raw
+
+_PDF_PROMPT_CHARS = 20000   # PDF text sent to the model
+_PDF_GUIDANCE_CHARS = 1000  # leading slice used to pick guidance item types
 
-def cir_from_pdf_text(pdf_text: str, defaults: Dict) -> Tuple[Dict, str]:
-    system = _system_with_guidance(pdf_text[:1000], defaults)
+async def cir_from_pdf_text(pdf_text: str, defaults: Dict) -> Tuple[Dict, str]:
+    trunc = pdf_text[:_PDF_PROMPT_CHARS]  # slice the (possibly huge) text once
+    key = _cache_key("pdf", trunc, defaults)  # only the truncated text reaches the model
+    hit = _cache_get(key)
+    if hit is not None:
+        return hit
+    system = _system_with_guidance(trunc[:_PDF_GUIDANCE_CHARS], defaults)
     prompt = f"""Convert this paper form text into Ocean CIR.
 
 PDF text (normalize headings/fields; avoid duplicates):
 ---
-{pdf_text[:20000]}
+{trunc}
 ---
 
 Defaults: {json.dumps(defaults)}
@@ -108,7 +193,9 @@ Return ONLY CIR JSON."""
         {"role": "system", "content": system},
         {"role": "user", "content": prompt},
     ]
-    cir = _chat_with_schema(messages, CIR_JSON_SCHEMA)
+    cir = await _chat_with_schema(messages, CIR_JSON_SCHEMA)
     if AUTO_REPAIR_ENABLED:
-        cir = auto_repair_cir(cir)
-    return cir, json.dumps(cir, ensure_ascii=False)
+        cir = auto_repair_cir(cir, in_place=True)  # freshly parsed, nothing else holds it
+    raw = _json_dumps(cir)
+    _cache_put(key, cir, raw)
+    return cir, raw
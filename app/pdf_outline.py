@@ -1,21 +1,78 @@
 # app/pdf_outline.py
 from io import BytesIO
-from typing import Tuple
+from typing import BinaryIO, Tuple, Union
 from pypdf import PdfReader
+try:
+    import pypdfium2 as pdfium  # native PDFium text extraction, far faster than pure-Python pypdf
+except ImportError:
+    pdfium = None
 
-def extract_outline_from_pdf(pdf_bytes: bytes, filename: str = "") -> Tuple[str, int]:
+def _extract_with_pdfium(pdf: Union[bytes, BinaryIO]) -> Tuple[str, int]:
+    doc = pdfium.PdfDocument(pdf)
+    try:
+        pages = []
+        for page in doc:
+            textpage = page.get_textpage()
+            try:
+                txt = textpage.get_text_range().replace("\r\n", "\n").strip()
+            finally:
+                textpage.close()
+                page.close()
+            if txt:
+                pages.append(txt)
+        return "\n\n".join(pages), len(doc)
+    finally:
+        doc.close()
+
+def _may_have_text(page) -> bool:
     """
-    Lightweight, dependency-free text extractor using pypdf.
-    Returns (plain_text, page_count).
+    Cheap resource probe: text needs a font, either on the page or inside a form
+    XObject. Blank and scanned (image-only) pages have neither, so the costly
+    content-stream parse in extract_text() can be skipped for them.
     """
-    reader = PdfReader(BytesIO(pdf_bytes))
+    try:
+        res = page.get("/Resources")
+        res = res.get_object() if res is not None else None
+        if not res:
+            return False
+        if "/Font" in res:
+            return True
+        xobjs = res.get("/XObject")
+        xobjs = xobjs.get_object() if xobjs is not None else None
+        return any(x.get_object().get("/Subtype") != "/Image" for x in (xobjs or {}).values())
+    except Exception:
+        return True  # unusual structure: let extract_text() decide
+
+def _extract_with_pypdf(pdf: Union[bytes, BinaryIO]) -> Tuple[str, int]:
+    reader = PdfReader(BytesIO(pdf) if isinstance(pdf, (bytes, bytearray)) else pdf)
     pages = []
-    for i, p in enumerate(reader.pages):
+    count = 0  # counted while iterating; no second pass over reader.pages
+    for p in reader.pages:
+        count += 1
+        if not _may_have_text(p):
+            continue
         try:
             txt = p.extract_text() or ""
         except Exception:
             txt = ""
-        if txt.strip():
-            pages.append(txt.strip())
+        txt = txt.strip()
+        if txt:
+            pages.append(txt)
     text = "\n\n".join(pages)
-    return text, len(reader.pages or [])
+    return text, count
+
+def extract_outline_from_pdf(pdf: Union[bytes, BinaryIO], filename: str = "") -> Tuple[str, int]:
+    """
+    Lightweight text extractor: pypdfium2 when installed, pypdf otherwise (or when
+    PDFium can't open the file).
+    `pdf` is the raw bytes or a seekable binary stream (e.g. an upload's spooled
+    temp file, read in place without copying it into memory).
+    Returns (plain_text, page_count).
+    """
+    if pdfium is not None:
+        try:
+            return _extract_with_pdfium(pdf)
+        except pdfium.PdfiumError:
+            if not isinstance(pdf, (bytes, bytearray)):
+                pdf.seek(0)
+    return _extract_with_pypdf(pdf)
@@ -1,6 +1,7 @@
 from __future__ import annotations
-import os, re, copy
-from typing import Dict, List, Set
+import os, re
+from typing import Dict, List, Optional, Set, Tuple
+from app.jsonutil import copy_json
 
 AUTO_REPAIR_ENABLED = os.getenv("AUTO_REPAIR", "1") != "0"
 
@@ -10,19 +11,34 @@ _EQ_SINGLE = re.compile(r"(?<![=!<>])=(?!=)")          # lone "=" -> "=="
 CURLY_REF  = re.compile(r"\{([A-Za-z0-9_]+)\}")        # {q1} -> q1
 TOKEN      = re.compile(r"\b([A-Za-z_][A-Za-z0-9_]{0,63})\b", re.ASCII)
 SUM_CALL   = re.compile(r"(?i)\bSUM\s*\((.+)\)")
+_COMP_RE   = re.compile(r"\s*(==|!=|>=|<=|>|<)\s*([^)&|]+)")   # "ref <op> rhs" right after a ref
+_ARITH_RE  = re.compile(r"\s*[\+\-\*/]")                       # "ref <arith-op>" right after a ref
 
 # -------- small utils --------
 
-def _is_number_literal(s: str) -> bool:
+def _try_number(s: str) -> Optional[float]:
+    """float(s) when s is a number literal, else None. Words (the usual non-numeric
+    case) are rejected up front: the only ones float() accepts start inf/nan."""
+    if s[:1].isalpha() and s[:3].lower() not in ("inf", "nan"):
+        return None
     try:
-        float(s)
-        return True
+        return float(s)
     except Exception:
-        return False
+        return None
+
+def _is_number_literal(s: str) -> bool:
+    return _try_number(s) is not None
 
 def _split_csv(s: str) -> List[str]:
     return [t.strip() for t in (s or "").split(",") if t and t.strip()]
 
+# Common Ocean script/macros / session vars, matched in one scan (vs one `in` per fragment)
+_DEFAULT_TEXT_FRAGMENTS = (
+    "@pt", "@patient", "@ptCpp.", "ScriptUtil.", "firstTime", "daysSinceLastCompleted",
+    "lastCompletedTag", "pt.", "$$",  # '$$' should only be used in the item's own c/cNote, not as a prompt
+)
+_DEFAULT_TEXT_RE = re.compile("|".join(map(re.escape, _DEFAULT_TEXT_FRAGMENTS)))
+
 def _looks_like_default_text(s: str) -> bool:
     """Heuristic: default/macros belong in <text>, not in the patient-facing <c> label."""
     if not s:
@@ -30,12 +46,7 @@ def _looks_like_default_text(s: str) -> bool:
     s = s.strip()
     if s.startswith("@"):
         return True
-    # Common Ocean script/macros / session vars:
-    bad_fragments = (
-        "@pt", "@patient", "@ptCpp.", "ScriptUtil.", "firstTime", "daysSinceLastCompleted",
-        "lastCompletedTag", "pt.", "$$",  # '$$' should only be used in the item's own c/cNote, not as a prompt
-    )
-    return any(frag in s for frag in bad_fragments)
+    return _DEFAULT_TEXT_RE.search(s) is not None
 
 def _fix_sum(formula: str, item_refs: Set[str], section_refs: Set[str]) -> str:
     if not formula:
@@ -71,24 +82,27 @@ def _decide_dot(rhs: str) -> str:
 def _normalize_expr(expr: str, known_refs: Set[str]) -> str:
     if not expr or not isinstance(expr, str):
         return expr
-    e = CURLY_REF.sub(r"\1", expr)      # {q1} -> q1
-    e = _EQ_SINGLE.sub("==", e)         # "=" -> "=="
+    # Each rewrite is gated on a character its pattern can't match without, so
+    # expressions that need no fixing skip the regex engine (as in normalizers_soft).
+    e = CURLY_REF.sub(r"\1", expr) if "{" in expr else expr  # {q1} -> q1
+    if "=" in e:
+        e = _EQ_SINGLE.sub("==", e)     # "=" -> "=="
     # Add .p/.r when missing
     def repl(m):
         ref = m.group(1)
         if ref not in known_refs:
             return m.group(0)
-        # already qualified?
-        tail = m.string[m.end():]
-        if tail.startswith(".p") or tail.startswith(".r"):
+        # already qualified? (probe the text after the token in place, no tail slice)
+        s, end = m.string, m.end()
+        if s.startswith(".p", end) or s.startswith(".r", end):
             return m.group(0)
         # comparator
-        comp_m = re.match(r"\s*(==|!=|>=|<=|>|<)\s*([^)&|]+)", tail)
+        comp_m = _COMP_RE.match(s, end)
         if comp_m:
             rhs = comp_m.group(2)
             return f"{ref}{_decide_dot(rhs)}"
         # arithmetic usage -> assume numeric points
-        if re.match(r"\s*[\+\-\*/]", tail):
+        if _ARITH_RE.match(s, end):
             return f"{ref}.p"
         return f"{ref}.r"
     return TOKEN.sub(repl, e)
@@ -105,30 +119,42 @@ def _ensure_points_on_numeric_choices(item: Dict) -> None:
             continue
         if "points" in c and c["points"] not in (None, ""):
             continue
-        val = (c.get("val") or "").strip()
-        if _is_number_literal(val):
-            try:
-                c["points"] = float(val)
-            except Exception:
-                pass
-
-def _collect_refs(section: Dict, section_refs: Set[str], item_types: Dict[str,str]) -> None:
-    if not section:
-        return
-    if section.get("ref"):
-        section_refs.add(section["ref"])
-    items = section.get("items") or []
-    for ch in items:
-        if not ch:
+        num = _try_number((c.get("val") or "").strip())
+        if num is not None:
+            c["points"] = num
+
+def _collect_refs(sections: List[Dict], section_refs: Set[str], item_types: Dict[str,str]) -> List[Tuple[Dict, bool, bool]]:
+    """
+    Single walk over the tree: records section refs
+    and item ref -> type, settles each child's kind, and returns every node as
+    (node, is_section, is_first) with sections ahead of their descendants, so the
+    repair pass can visit the nodes without descending the tree again.
+    """
+    flat: List[Tuple[Dict, bool, bool]] = []
+    stack = [(s, idx == 0) for idx, s in reversed(list(enumerate(sections)))]
+    while stack:
+        section, is_first = stack.pop()
+        flat.append((section, True, is_first))
+        if not section:
             continue
-        k = ch.get("kind") or ("section" if ch.get("type") == "SECTION" else "item")
-        ch["kind"] = k
-        if k == "section":
-            _collect_refs(ch, section_refs, item_types)
-        else:
-            ref = ch.get("ref")
-            if ref:
-                item_types[ref] = ch.get("type")
+        if section.get("ref"):
+            section_refs.add(section["ref"])
+        items = section.get("items") or []
+        nested = []
+        for ch in items:
+            if not ch:
+                continue
+            k = ch.get("kind") or ("section" if ch.get("type") == "SECTION" else "item")
+            ch["kind"] = k
+            if k == "section":
+                nested.append((ch, False))
+            else:
+                flat.append((ch, False, False))
+                ref = ch.get("ref")
+                if ref:
+                    item_types[ref] = ch.get("type")
+        stack.extend(reversed(nested))
+    return flat
 
 def _unify_section_attrs(sec: Dict, is_first: bool) -> None:
     attrs = sec.get("attributes") or {}
@@ -224,36 +250,29 @@ def _repair_section(sec: Dict, is_first: bool, known_refs: Set[str], section_ref
         if isinstance(lbl, str) and lbl.strip():
             sec["header"] = lbl.strip()
 
-    # Recurse children
-    items = sec.get("items") or []
-    for ch in items:
-        if not ch:
-            continue
-        k = ch.get("kind") or ("section" if ch.get("type") == "SECTION" else "item")
-        ch["kind"] = k
-        if k == "section":
-            _repair_section(ch, False, known_refs, section_refs)
-        else:
-            _repair_item(ch, known_refs, section_refs)
-
 # -------- public API --------
 
-def auto_repair_cir(cir: Dict) -> Dict:
-    """Deterministic repairs to make CIR valid & Ocean-strict."""
-    c = copy.deepcopy(cir or {})
+def auto_repair_cir(cir: Dict, in_place: bool = False) -> Dict:
+    """
+    Deterministic repairs to make CIR valid & Ocean-strict.
+    in_place=True repairs and returns the caller's dict instead of a copy.
+    """
+    c = (cir if cir is not None else {}) if in_place else copy_json(cir or {})
     c.setdefault("meta", {})
     sections: List[Dict] = list(c.get("sections") or [])
     c["sections"] = sections
 
-    # Collect refs
+    # Collect refs (and the flat node list the repair pass walks)
     section_refs: Set[str] = set()
     item_types: Dict[str, str] = {}
-    for s in sections:
-        _collect_refs(s, section_refs, item_types)
+    flat = _collect_refs(sections, section_refs, item_types)
     known_refs = set(item_types.keys())
 
-    # Repair sections/items
-    for idx, s in enumerate(sections):
-        _repair_section(s, is_first=(idx == 0), known_refs=known_refs, section_refs=section_refs)
+    # Repair sections/items; children need no descent, each node is fixed on its own
+    for node, is_section, is_first in flat:
+        if is_section:
+            _repair_section(node, is_first=is_first, known_refs=known_refs, section_refs=section_refs)
+        else:
+            _repair_item(node, known_refs, section_refs)
 
     return c
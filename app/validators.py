@@ -1,8 +1,7 @@
 # app/validators.py
 import re
-from typing import Dict, List, Tuple
-from jsonschema import Draft202012Validator
-from app.cir_schema import CIR_JSON_SCHEMA
+from typing import Dict, Iterator, List, Tuple
+from app.cir_schema import CIR_VALIDATOR, is_valid_cir
 from app.enums import (
     ITEM_TYPES, FIELD_VALIDATOR_TYPES, HINTS, FLAG_COLORS, NOTE_STYLES,
     DATA_SECURITY_MODES, NOTE_TYPES, ITEM_SUBCATEGORIES, EMR_FIELDS
@@ -10,17 +9,24 @@ from app.enums import (
 from app.config import DEFAULT_NOTE_VERSION
 
 REF_RE = re.compile(r"^[A-Za-z0-9_]+$")
+_REF_NORMALIZE_RE = re.compile(r"[^A-Za-z0-9_]+")  # runs of ref-unsafe chars -> "_"
+_MENU_TYPES = frozenset(("MENU","MENU_MULTI_SELECT"))
 
-def _enum_fix(v: str, allowed: set) -> Tuple[str, bool]:
+def _enum_fix(v: str, allowed: frozenset) -> Tuple[str, bool]:
+    # Canonical values (the common case) cost one set probe; each case is folded once.
     if v in allowed: return v, False
-    if v.upper() in allowed: return v.upper(), True
-    if v.lower() in allowed: return v.lower(), True
+    u = v.upper()
+    if u in allowed: return u, True
+    l = v.lower()
+    if l in allowed: return l, True
     return v, False
 
 def validate_against_schema(cir: Dict) -> List[str]:
+    # Valid forms (the common case) never pay for full error collection.
+    if is_valid_cir(cir):
+        return []
     errors = []
-    v = Draft202012Validator(CIR_JSON_SCHEMA)
-    for err in v.iter_errors(cir):
+    for err in CIR_VALIDATOR.iter_errors(cir):
         loc = " → ".join(map(str, err.path))
         errors.append(f"{loc or 'root'}: {err.message}")
     return errors
@@ -33,35 +39,85 @@ def _add_validator(node: Dict, vtype: str, issues: List[str]):
         node["validator"]["type"] = vtype
         issues.append(f"repair: set validator.type={vtype} for {node.get('ref') or '(no-ref)'}")
 
+def _iter_nodes(sections: List[Dict]) -> Iterator[Dict]:
+    """Nodes in document order, descending only into kind == "section"."""
+    stack = list(reversed(sections))
+    while stack:
+        node = stack.pop()
+        yield node
+        if node.get("kind") == "section":
+            stack.extend(reversed(node.get("items") or []))
+
+def _item_heuristics(n: Dict, issues: List[str]):
+    text = (n.get("text") or "").lower()
+    itype = (n.get("type") or "").upper()
+    # Email/Phone/Postal validators
+    if any(k in text for k in ("email","e-mail")):
+        _add_validator(n, "EMAIL", issues)
+    if any(k in text for k in ("phone","telephone","cell")):
+        _add_validator(n, "PHONE", issues)
+    if any(k in text for k in ("postal","zip")):
+        _add_validator(n, "POSTAL_CODE", issues)
+    # Menu hints
+    ch = n.get("choices") or []
+    if itype in _MENU_TYPES and ch:
+        L = len(ch)
+        hints = set(n.get("hints") or [])
+        if L >= 7 and "USE_SEARCHABLE_MENU" not in hints:
+            hints.add("USE_SEARCHABLE_MENU")
+            n["hints"] = sorted(hints)
+            issues.append(f"repair: added USE_SEARCHABLE_MENU to {n.get('ref')}")
+        elif 3 <= L <= 6 and "USE_DROPDOWN_MENU" not in hints:
+            hints.add("USE_DROPDOWN_MENU")
+            n["hints"] = sorted(hints)
+            issues.append(f"repair: added USE_DROPDOWN_MENU to {n.get('ref')}")
+
 def _apply_heuristics(cir: Dict, issues: List[str]):
     """Small, safe repairs: add validators based on wording; menu hints based on size."""
-    def walk(n):
-        if n.get("kind") == "section":
-            for ch in (n.get("items") or []): walk(ch)
-        elif n.get("kind") == "item":
-            text = (n.get("text") or "").lower()
-            itype = (n.get("type") or "").upper()
-            # Email/Phone/Postal validators
-            if any(k in text for k in ["email","e-mail"]):
-                _add_validator(n, "EMAIL", issues)
-            if any(k in text for k in ["phone","telephone","cell"]):
-                _add_validator(n, "PHONE", issues)
-            if any(k in text for k in ["postal","zip"]):
-                _add_validator(n, "POSTAL_CODE", issues)
-            # Menu hints
-            ch = n.get("choices") or []
-            if itype in {"MENU","MENU_MULTI_SELECT"} and ch:
-                L = len(ch)
-                hints = set(n.get("hints") or [])
-                if L >= 7 and "USE_SEARCHABLE_MENU" not in hints:
-                    hints.add("USE_SEARCHABLE_MENU")
-                    n["hints"] = sorted(list(hints))
-                    issues.append(f"repair: added USE_SEARCHABLE_MENU to {n.get('ref')}")
-                elif 3 <= L <= 6 and "USE_DROPDOWN_MENU" not in hints:
-                    hints.add("USE_DROPDOWN_MENU")
-                    n["hints"] = sorted(list(hints))
-                    issues.append(f"repair: added USE_DROPDOWN_MENU to {n.get('ref')}")
-    for s in cir.get("sections", []): walk(s)
+    for n in _iter_nodes(cir.get("sections", [])):
+        if n.get("kind") == "item":
+            _item_heuristics(n, issues)
+
+def _normalize_section(node: Dict, issues: List[str]):
+    attrs = node.get("attributes", {}) or {}
+    if "headerStyle" in attrs and attrs["headerStyle"]:
+        v, fixed = _enum_fix(attrs["headerStyle"], NOTE_STYLES)
+        if fixed: issues.append(f"section.headerStyle→{v}")
+        attrs["headerStyle"] = v
+    if "flag" in attrs and attrs["flag"]:
+        v, fixed = _enum_fix(attrs["flag"], FLAG_COLORS)
+        if fixed: issues.append(f"section.flag→{v}")
+        attrs["flag"] = v
+
+def _normalize_item(node: Dict, issues: List[str], seen_refs: set, base_counters: Dict[str, int]):
+    if "type" in node and node["type"]:
+        v, fixed = _enum_fix(node["type"], ITEM_TYPES)
+        if fixed: issues.append(f"item.type {node['type']}→{v}")
+        node["type"] = v
+    for k in ("flag","negFlag"):
+        if node.get(k):
+            v, fixed = _enum_fix(node[k], FLAG_COLORS)
+            if fixed: issues.append(f"item.{k}→{v}")
+            node[k] = v
+    if node.get("validator") and node["validator"].get("type"):
+        v, fixed = _enum_fix(node["validator"]["type"], FIELD_VALIDATOR_TYPES)
+        if fixed: issues.append(f"validator.type→{v}")
+        node["validator"]["type"] = v
+    # ref hygiene
+    if not node.get("ref"):
+        base = _REF_NORMALIZE_RE.sub("_", (node.get("text") or "item").strip())[:24] or "item"
+        # Resume after the last index handed out for this base: everything below it is
+        # already taken (seen_refs only grows), so many unnamed items stay O(1) each.
+        idx = base_counters.get(base, 0) + 1
+        while f"{base}_{idx}" in seen_refs: idx += 1
+        base_counters[base] = idx
+        node["ref"] = f"{base}_{idx}"
+        issues.append(f"item.ref generated: {node['ref']}")
+    if not REF_RE.match(node["ref"]):
+        fixed = _REF_NORMALIZE_RE.sub("_", node["ref"]) or "ITEM"
+        issues.append(f"item.ref '{node['ref']}'→'{fixed}'")
+        node["ref"] = fixed
+    seen_refs.add(node["ref"])
 
 def normalize_enums_and_defaults(cir: Dict) -> List[str]:
     issues: List[str] = []
@@ -78,48 +134,15 @@ def normalize_enums_and_defaults(cir: Dict) -> List[str]:
         if fixed: issues.append(f"meta.noteType→{v}")
         meta["noteType"] = v
 
-    # walk
-    def walk(node, seen_refs: set):
-        if node.get("kind") == "section":
-            attrs = node.get("attributes", {}) or {}
-            if "headerStyle" in attrs and attrs["headerStyle"]:
-                v, fixed = _enum_fix(attrs["headerStyle"], NOTE_STYLES)
-                if fixed: issues.append(f"section.headerStyle→{v}")
-                attrs["headerStyle"] = v
-            if "flag" in attrs and attrs["flag"]:
-                v, fixed = _enum_fix(attrs["flag"], FLAG_COLORS)
-                if fixed: issues.append(f"section.flag→{v}")
-                attrs["flag"] = v
-            for ch in node.get("items", []) or []:
-                walk(ch, seen_refs)
-        elif node.get("kind") == "item":
-            if "type" in node and node["type"]:
-                v, fixed = _enum_fix(node["type"], ITEM_TYPES)
-                if fixed: issues.append(f"item.type {node['type']}→{v}")
-                node["type"] = v
-            for k in ("flag","negFlag"):
-                if node.get(k):
-                    v, fixed = _enum_fix(node[k], FLAG_COLORS)
-                    if fixed: issues.append(f"item.{k}→{v}")
-                    node[k] = v
-            if node.get("validator") and node["validator"].get("type"):
-                v, fixed = _enum_fix(node["validator"]["type"], FIELD_VALIDATOR_TYPES)
-                if fixed: issues.append(f"validator.type→{v}")
-                node["validator"]["type"] = v
-            # ref hygiene
-            if not node.get("ref"):
-                base = re.sub(r"[^A-Za-z0-9_]+", "_", (node.get("text") or "item").strip())[:24] or "item"
-                idx = 1
-                while f"{base}_{idx}" in seen_refs: idx += 1
-                node["ref"] = f"{base}_{idx}"
-                issues.append(f"item.ref generated: {node['ref']}")
-            if not REF_RE.match(node["ref"]):
-                fixed = re.sub(r"[^A-Za-z0-9_]+", "_", node["ref"]) or "ITEM"
-                issues.append(f"item.ref '{node['ref']}'→'{fixed}'")
-                node["ref"] = fixed
-            seen_refs.add(node["ref"])
+    # walk (document order matters: generated refs depend on the refs seen so far)
     seen = set()
-    for s in cir.get("sections", []): walk(s, seen)
+    base_counters: Dict[str, int] = {}
+    for node in _iter_nodes(cir.get("sections", [])):
+        kind = node.get("kind")
+        if kind == "section":
+            _normalize_section(node, issues)
+        elif kind == "item":
+            _normalize_item(node, issues, seen, base_counters)
     return issues
 
 def validate_and_normalize_cir(cir: Dict) -> Dict:
@@ -130,13 +153,16 @@ def validate_and_normalize_cir(cir: Dict) -> Dict:
     # 3) schema validation
     schema_errors = validate_against_schema(cir)
     issues.extend(schema_errors)
-    # 4) duplicate refs
-    def collect_refs(node, bag):
-        if node.get("kind") == "item" and node.get("ref"): bag.append(node["ref"])
-        for ch in (node.get("items") or []): collect_refs(ch, bag)
-    refs = []
-    for s in cir.get("sections", []): collect_refs(s, refs)
-    dupes = {r for r in refs if refs.count(r) > 1}
-    if dupes: issues.append(f"duplicate item refs: {sorted(list(dupes))}")
+    # 4) duplicate refs (one pass: a ref seen before is a dupe; no O(n²) refs.count)
+    seen, dupes = set(), set()
+    stack = list(cir.get("sections", []))
+    while stack:
+        node = stack.pop()
+        if node.get("kind") == "item" and node.get("ref"):
+            r = node["ref"]
+            if r in seen: dupes.add(r)
+            else: seen.add(r)
+        stack.extend(node.get("items") or [])
+    if dupes: issues.append(f"duplicate item refs: {sorted(dupes)}")
     ok = (len(schema_errors) == 0) and (not dupes)
     return {"ok": ok, "issues": issues, "cir": cir}
@@ -0,0 +1,62 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import main
+
+client = TestClient(main.app)
+
+# What the routes answered when they declared `cir: dict` and let FastAPI parse it
+_ref = FastAPI()
+
+
+@_ref.post("/v1/validate-cir")
+async def _ref_validate(cir: dict):
+    return {"ok": True}
+
+
+ref_client = TestClient(_ref)
+
+_JSON = {"content-type": "application/json"}
+
+
+@pytest.mark.parametrize("body", [
+    b"",
+    b"{",
+    b'{"meta": }',
+    b"{'meta': {}}",
+    b'{"meta": {}} trailing',
+    b"[]",
+    b'[{"meta": {}}]',
+    b'"cir"',
+    b"42",
+    b"null",
+    b"\xff\xfe{",
+])
+def test_bad_bodies_get_fastapi_errors(body):
+    got = client.post("/v1/validate-cir", content=body, headers=_JSON)
+    want = ref_client.post("/v1/validate-cir", content=body, headers=_JSON)
+    assert got.status_code == want.status_code
+    assert got.json() == want.json()
+
+
+def _cir_with_points(points: str) -> bytes:
+    return (
+        '{"meta": {"ref": "NF", "title": "Non-finite"}, "sections": [{"kind": "section",'
+        ' "ref": "s1", "header": "Q", "items": [{"kind": "item", "ref": "q1", "type": "MENU",'
+        ' "label": "Pick", "choices": [{"val": "0", "points": 0}, {"val": "1", "points": %s}]}]}]}'
+        % points
+    ).encode()
+
+
+@pytest.mark.parametrize("points", ["Infinity", "-Infinity", "NaN", "1e400"])
+def test_non_finite_numbers_are_accepted(points):
+    r = client.post("/v1/compose-xml", content=_cir_with_points(points), headers=_JSON)
+    assert r.status_code == 200, r.text
+    assert r.headers["content-type"].startswith("application/xml")
+    assert b'ref="q1"' in r.content
+
+
+def test_finite_body_composes():
+    r = client.post("/v1/compose-xml", content=_cir_with_points("3"), headers=_JSON)
+    assert r.status_code == 200, r.text
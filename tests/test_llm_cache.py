@@ -0,0 +1,61 @@
+import math
+from collections import OrderedDict
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main, openai_client
+
+
+def _model_cir(val):
+    # The repair pass fills missing points from numeric vals, and "inf"/"nan" parse
+    # as non-finite floats.
+    return {
+        "meta": {"ref": "Cached", "title": "Cached form"},
+        "sections": [{
+            "kind": "section", "ref": "s1", "header": "Questions",
+            "items": [{
+                "kind": "item", "ref": "q1", "type": "MENU", "label": "Pick one",
+                "choices": [{"val": "0"}, {"val": val}],
+            }],
+        }],
+    }
+
+
+@pytest.fixture
+def cached(monkeypatch):
+    monkeypatch.setattr(openai_client, "LLM_CACHE_SIZE", 8)
+    monkeypatch.setattr(openai_client, "_llm_cache", OrderedDict())
+
+
+@pytest.mark.parametrize("val", ["inf", "nan"])
+def test_non_finite_points_same_on_miss_and_hit(cached, monkeypatch, val):
+    calls = []
+
+    async def fake_chat(messages, schema):
+        calls.append(messages)
+        return _model_cir(val)
+
+    monkeypatch.setattr(openai_client, "_chat_with_schema", fake_chat)
+    client = TestClient(main.app)
+    form = {"description": "A one question menu", "ref": "Cached"}
+    miss = client.post("/v1/create-from-description-xml", data=form)
+    hit = client.post("/v1/create-from-description-xml", data=form)
+    assert len(calls) == 1  # the second request was served from the cache
+    assert miss.status_code == 200, miss.text
+    assert hit.status_code == 200, hit.text
+    assert hit.content == miss.content
+
+
+def test_cache_hit_is_a_private_copy(cached):
+    key = openai_client._cache_key("description", "d", {})
+    cir = _model_cir("1")
+    cir["sections"][0]["items"][0]["choices"][1]["points"] = math.inf
+    openai_client._cache_put(key, cir, "{}")
+    cir["meta"]["ref"] = "Changed"
+    first, _ = openai_client._cache_get(key)
+    first["sections"].clear()
+    second, _ = openai_client._cache_get(key)
+    assert second["meta"]["ref"] == "Cached"
+    assert second["sections"][0]["items"][0]["choices"][1]["points"] == math.inf
+
@@ -0,0 +1,98 @@
+"""
+The tree walks in the composer, repair, soft-repair and validators follow
+nested sections without recursing. tests/data/nested_walks_baseline.json holds
+what the recursive versions (the baseline tree) produced for nested_cir();
+pre-order, sibling order and first-section handling must stay the same.
+"""
+import copy
+import json
+import sys
+from pathlib import Path
+from xml.etree.ElementTree import canonicalize
+
+import pytest
+
+from app.composer import compose_xml
+from app.normalizers_soft import soft_repair_cir
+from app.repair import auto_repair_cir
+from app.validators import _iter_nodes, validate_and_normalize_cir
+
+BASELINE = json.loads((Path(__file__).parent / "data" / "nested_walks_baseline.json").read_text("utf-8"))
+
+
+def nested_cir(dup=True):
+    # Sections three deep, items before and after each nested section, kind set
+    # three ways, and (with dup) one ref repeated in a later top-level section.
+    return {
+        "meta": {"ref": "Nested", "title": "Nested walk"},
+        "sections": [
+            {"ref": "s1", "header": "First", "items": [
+                {"ref": "q1", "type": "MENU", "label": "Score", "choices": [{"val": "0"}, {"val": "1"}, {"val": "2"}]},
+                {"kind": "section", "ref": "s1a", "header": "Inner", "attributes": {"showIf": "q1 = 1"}, "items": [
+                    {"ref": "q2", "type": "menu", "label": "Second", "choices": [{"val": "0"}, {"val": "3"}]},
+                    {"kind": "section", "ref": "s1b", "items": [
+                        {"ref": "total", "type": "FORMULA", "formula": "SUM(q1, q2)"},
+                        {"ref": "dup", "type": "TEXT_FIELD", "label": "Deep dup"},
+                    ]},
+                    {"ref": "after", "type": "TEXT_AREA", "label": "After inner", "showIf": "q2 > 0"},
+                ]},
+                {"ref": "q4", "type": "CHECKBOX", "label": "Last of first"},
+            ]},
+            {"ref": "s2", "header": "Second", "items": [
+                {"ref": "dup" if dup else "dup2", "type": "LABEL", "label": "Later dup"},
+                {"kind": "section", "ref": "s2a", "items": [
+                    {"ref": "sum2", "type": "FORMULA", "formula": "SUM({s1a})"},
+                ]},
+            ]},
+        ],
+    }
+
+
+def _pipeline(cir):
+    repaired = auto_repair_cir(cir)
+    soft = soft_repair_cir(repaired)
+    return repaired, soft, validate_and_normalize_cir(copy.deepcopy(soft))
+
+
+def test_repair_matches_recursive_baseline():
+    repaired, soft, _ = _pipeline(nested_cir())
+    assert repaired == BASELINE["repair"]
+    assert soft == BASELINE["soft"]
+
+
+def test_validation_matches_recursive_baseline():
+    _, _, v = _pipeline(nested_cir())
+    assert {"ok": v["ok"], "issues": v["issues"], "cir": v["cir"]} == BASELINE["validate"]
+
+
+def test_xml_matches_recursive_baseline():
+    _, _, v = _pipeline(nested_cir(dup=False))
+    assert v["ok"], v["issues"]
+    assert canonicalize(compose_xml(v["cir"]), strip_text=True) == BASELINE["xml"]
+
+
+def test_iter_nodes_is_pre_order():
+    refs = [n.get("ref") for n in _iter_nodes(auto_repair_cir(nested_cir())["sections"])]
+    assert refs == ["s1", "q1", "s1a", "q2", "s1b", "total", "dup", "after", "q4",
+                    "s2", "dup", "s2a", "sum2"]
+
+
+@pytest.fixture
+def deep_cir():
+    depth = sys.getrecursionlimit() * 2
+    node = {"kind": "item", "ref": "leaf", "type": "TEXT_FIELD", "label": "Deepest"}
+    for i in range(depth):
+        node = {"kind": "section", "ref": f"s{i}", "items": [node]}
+    return {"meta": {"ref": "Deep", "title": "Deep"}, "sections": [node]}, depth
+
+
+def test_nesting_deeper_than_the_recursion_limit(deep_cir):
+    cir, depth = deep_cir
+    cir = auto_repair_cir(cir, in_place=True)
+    cir = soft_repair_cir(cir, in_place=True)
+    nodes = list(_iter_nodes(cir["sections"]))
+    assert len(nodes) == depth + 1
+    assert nodes[-1]["ref"] == "leaf"
+    xml = compose_xml(cir)
+    assert xml.count(b"<section ") == depth
+    assert b'ref="leaf"' in xml